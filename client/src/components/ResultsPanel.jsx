@@ -49,6 +49,19 @@ function ResultsPanel({
 
   return (
     <div className="space-y-6">
+      {/* Partial result: the time budget ran out before every file compiled */}
+      {results.partial && (
+        <div className="glass rounded-xl p-4 border border-orange-500/50 flex items-center gap-3">
+          <AlertTriangle className="w-6 h-6 text-orange-400 shrink-0" />
+          <p className="text-orange-300">
+            Partial result: {results.notGraded} files were not graded before
+            the time budget ran out, so {results.ungradedStudents} students
+            have ungraded questions (shown as —). Statistics cover fully
+            graded students only.
+          </p>
+        </div>
+      )}
+
       {/* Summary Cards */}
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-4">
         {/* Total Students */}
@@ -232,7 +245,11 @@ function ResultsPanel({
                     </td>
                     {student.questions.map((q, qIndex) => (
                       <td key={qIndex} className="p-3 text-center">
-                        {q > 0 ? (
+                        {q === null ? (
+                          <span className="text-gray-500" title="Not graded">
+                            —
+                          </span>
+                        ) : q > 0 ? (
                           <span className="inline-flex items-center gap-1 text-green-400">
                             <CheckCircle className="w-4 h-4" />
                             {q}
@@ -0,0 +1,88 @@
+"""
+Adaptive admission control for concurrent gcc runs.
+
+AdaptiveLimiter is a counting limiter (acquire/release) whose number of
+slots moves between 1 and a maximum, following the machine's load average
+and available memory. It shrinks when the box is overloaded or short of memory
+and grows back when there is headroom.
+"""
+
+import os
+import threading
+import time
+
+
+def load_average():
+    """1-minute load average, or None where the OS does not provide it"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo in MB, or None if unknown"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class AdaptiveLimiter:
+    """
+    Counting limiter whose capacity adapts to load and free memory.
+    The compile scheduler takes its slots with acquire() and release().
+    """
+
+    def __init__(self, max_slots, min_slots=1, memory_per_slot_mb=256, interval=1.0):
+        self.max_slots = max(1, max_slots)
+        self.min_slots = max(1, min(min_slots, self.max_slots))
+        self.memory_per_slot_mb = memory_per_slot_mb
+        self.interval = interval
+        self.limit = self.max_slots
+        self.active = 0
+        self.waiting = 0
+        self._cpus = os.cpu_count() or 1
+        self._last_adjust = 0.0
+        self._cond = threading.Condition()
+
+    def _adjust(self):
+        """Recompute the limit at most once per interval (lock held)"""
+        now = time.monotonic()
+        if now - self._last_adjust < self.interval:
+            return
+        self._last_adjust = now
+
+        load = load_average()
+        free_mb = available_memory_mb()
+        overloaded = load is not None and load > self._cpus * 1.5
+        low_memory = free_mb is not None and free_mb < self.memory_per_slot_mb * 2
+        headroom = (load is None or load < self._cpus) and \
+            (free_mb is None or free_mb > self.memory_per_slot_mb * 4)
+
+        if (overloaded or low_memory) and self.limit > self.min_slots:
+            self.limit -= 1
+        elif headroom and self.limit < self.max_slots:
+            self.limit += 1
+            self._cond.notify()
+
+    def acquire(self):
+        with self._cond:
+            self.waiting += 1
+            try:
+                self._adjust()
+                while self.active >= self.limit:
+                    self._cond.wait(timeout=self.interval)
+                    self._adjust()
+                self.active += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
@@ -3,485 +3,98 @@ C Programming Autograder - Python Flask API
 Provides grading functionality via REST API endpoints
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor, wait
+import base64
+import gzip
 import os
-import re
-import subprocess
-from collections import defaultdict
+import select
+import socket
+import threading
 import traceback
 
+from grader import (
+    DEFAULT_CONFIG,
+    DIAGNOSTICS,
+    GRADER_WORKERS,
+    HISTORY,
+    METRICS,
+    PCH_STORE,
+    grade_distributed,
+    error_records,
+    grade_submissions,
+    is_archive,
+    match_filename,
+    resolve_filenames,
+)
+from jobs import GradingJob, JobRegistry
+from results_store import ResultStore
+
 app = Flask(__name__)
 CORS(app)
 
-# Default configuration
-DEFAULT_CONFIG = {
-    'totalQuestions': 6,
-    'marksPerQuestion': 2.5,
-    'compilationTimeout': 60,
-    'courseName': 'CSE115',
-    'sectionName': 'Section 10',
-    'assignmentName': 'Assignment 2'
-}
+# Background grading jobs started with {"async": true}
+JOBS = JobRegistry()
 
+# Completed results kept for paging with {"store": true}
+RESULTS = ResultStore(max_results=int(os.environ.get('GRADER_RESULTS_MAX', 20)))
 
-# =============================================================================
-# Filename Parser - Extracts student name and question number
-# =============================================================================
+# JSON bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
 
-def parse_filename(filename, total_questions=6):
-    """
-    Parse the filename to extract student name and question number.
-    Handles multiple naming conventions from various students.
-    
-    Returns: (student_name, question_number, sub_part)
-    """
-    # Remove .c/.C extension
-    base_name = filename.lower().replace('.c', '')
-    original_base = filename.replace('.c', '').replace('.C', '')
-    
-    # Split by underscore
-    parts = original_base.split('_')
-    
-    if len(parts) < 2:
-        return None, None, None
-    
-    # Student name is always the first part (lowercase for consistency)
-    student_name = parts[0].lower()
-    
-    # =========================================================================
-    # SPECIAL PATTERNS FIRST (more specific)
-    # =========================================================================
-    
-    # Pattern S1: "A-2-X" format (Assignment 2, Question X)
-    match = re.search(r'a-2-(\d+)([a-z])?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern S2: "CX" format (like C1, C2, C3)
-    match = re.search(r'[_]c(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Pattern S3: "PX" or "P X" or "pXa/pXb" format
-    match = re.search(r'[_]p(\d+)\s*([a-z])?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern S4: "2)ans XX" format
-    match = re.search(r'2\)ans\s*(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Pattern S4b: "2)ans XX part Y" format
-    match = re.search(r'2\)ans\s*(\d+)\s*part\s*(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        part_num = int(match.group(2))
-        sub_part = chr(ord('a') + part_num - 1) if part_num <= 26 else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern S5: "X.0" format (like 1.0, 2.0, 3a.0)
-    match = re.search(r'[_](\d+)([a-z])?\.0', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern S6: "UntitledX" format
-    match = re.search(r'untitled(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-        elif q_num <= total_questions + 2:
-            return student_name, total_questions, chr(ord('a') + q_num - total_questions)
-    
-    # Pattern S7: "main-X" format (like main-1, main-2)
-    match = re.search(r'main-(\d+)(?![a-f0-9\-])', base_name)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-        elif q_num == total_questions + 1:
-            return student_name, total_questions, 'b'
-    
-    # Pattern S8: "Assighnment2.X" format (misspelled)
-    match = re.search(r'assig[hn]+ment2\.(\d+)([a-z])?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern S9: "cse115-X no" format
-    match = re.search(r'cse115-?(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Pattern S10: "NoX" or "no-X" or "no X" format
-    match = re.search(r'no[_\-\s]?(\d+)([a-z])?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern S11: "Xa" or "Xb" standalone (like 5a, 5b, 6a)
-    match = re.search(r'[_](\d)([a-z])(?:\.|\-|$)', base_name)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2)
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # =========================================================================
-    # STANDARD PATTERNS
-    # =========================================================================
-    
-    # Pattern 1: "question X(a)" or "question X(b)" format
-    match = re.search(r'question[_\-\s]*(\d+)\s*\(?([a-z])?\)?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern 2: "problem X" or "problem-X" format
-    match = re.search(r'problem[_\-\s]*(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Pattern 3: "assignment X" or "assignment Xa/Xb" format
-    match = re.search(r'assignment[_\-\s]*(\d+)\s*[\-]?([a-z])?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern 4: "Q-X" or "Q_X" or "QX" format with optional sub-part
-    match = re.search(r'q[_\-\s]?(\d+)\s*[\-]?\s*\(?([a-z])?\)?', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2).lower() if match.group(2) else None
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Pattern 5: "aX" format (like a1, a2, a3)
-    match = re.search(r'[_]a(\d+)', base_name, re.IGNORECASE)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Pattern 6: Check last part for patterns
-    last_part = parts[-1].lower()
-    
-    # Sub-pattern 6a: "Xa" or "X-a" format (e.g., 3a, 4b)
-    match = re.match(r'^(\d+)[_\-]?([a-z])$', last_part)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2)
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Sub-pattern 6b: Just a number with suffix like "1-1", "2-3"
-    match = re.match(r'^(\d+)[\-]?\d*$', last_part)
-    if match:
-        q_num = int(match.group(1))
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Sub-pattern 6c: Just a single number
-    if last_part.isdigit():
-        q_num = int(last_part)
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, None
-    
-    # Pattern 7: Handle special format "X(a)" or "X(b)"
-    match = re.search(r'(\d)\(([a-z])\)', base_name)
-    if match:
-        q_num = int(match.group(1))
-        sub_part = match.group(2)
-        if 1 <= q_num <= total_questions:
-            return student_name, q_num, sub_part
-    
-    # Return None if no pattern matched
-    return student_name, None, None
+# How often a synchronous /grade checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.5
 
 
-def preprocess_files(submissions_dir, total_questions=6):
+def _requested_workers(workers):
     """
-    Pre-process files to map UUID-named files to Q1-QN based on submission order.
-    Returns: {filename: (question_num, sub_part)}
+    Worker URLs from a /grade body. Only workers listed in GRADER_WORKERS may
+    be chosen, so a request cannot send sources to an arbitrary host.
     """
-    file_mapping = {}
-    
-    # Get all C files
-    try:
-        all_files = os.listdir(submissions_dir)
-    except FileNotFoundError:
-        return file_mapping
-        
-    c_files = [f for f in all_files if f.lower().endswith('.c')]
-    
-    # Group files by student
-    student_files_raw = defaultdict(list)
-    for f in c_files:
-        parts = f.split('_')
-        if len(parts) >= 3:
-            student = parts[0].lower()
-            try:
-                sub_id = int(parts[2])
-                student_files_raw[student].append((sub_id, f))
-            except:
-                student_files_raw[student].append((0, f))
-    
-    # Process each student's files
-    for student, files in student_files_raw.items():
-        files.sort(key=lambda x: x[0])
-        
-        unassigned_files = []
-        for sub_id, filename in files:
-            name, q_num, sub_part = parse_filename(filename, total_questions)
-            if q_num is None:
-                unassigned_files.append((sub_id, filename))
-        
-        for i, (sub_id, filename) in enumerate(unassigned_files):
-            if i < total_questions:
-                q_num = i + 1
-                file_mapping[filename] = (q_num, None)
-            else:
-                file_mapping[filename] = (total_questions, chr(ord('a') + i - total_questions + 1))
-    
-    return file_mapping
+    if not isinstance(workers, list) or not workers:
+        raise ValueError('workers must be a non-empty list of worker URLs')
+    requested = []
+    for worker in workers:
+        if not isinstance(worker, str) or not worker.startswith(('http://', 'https://')):
+            raise ValueError(f'Not an http(s) worker URL: {worker!r}')
+        worker = worker.strip().rstrip('/')
+        if worker not in GRADER_WORKERS:
+            raise ValueError(f'Worker not listed in GRADER_WORKERS: {worker}')
+        requested.append(worker)
+    return requested
 
 
-def parse_filename_enhanced(filename, file_mapping, total_questions=6):
-    """Parse filename with fallback to pre-computed mapping"""
-    student_name, q_num, sub_part = parse_filename(filename, total_questions)
-    
-    if q_num is not None:
-        return student_name, q_num, sub_part
-    
-    if filename in file_mapping:
-        parts = filename.split('_')
-        student_name = parts[0].lower() if parts else None
-        q_num, sub_part = file_mapping[filename]
-        return student_name, q_num, sub_part
-    
-    return student_name, None, None
-
-
-# =============================================================================
-# Compilation Function
-# =============================================================================
-
-def compile_c_file(filepath, timeout=60):
-    """
-    Attempt to compile a C file using gcc.
-    Returns: (success: bool, error_message: str or None)
-    """
-    base_name = os.path.splitext(os.path.basename(filepath))[0]
-    temp_exe = os.path.join(os.path.dirname(filepath), f"{base_name}_temp.exe")
-    
+def _client_disconnected():
+    """True once the client of the current request has closed its connection"""
+    sock = request.environ.get('werkzeug.socket') or request.environ.get('gunicorn.socket')
+    if sock is None:
+        return False
     try:
-        result = subprocess.run(
-            ["gcc", filepath, "-o", temp_exe],
-            capture_output=True,
-            text=True,
-            timeout=timeout
-        )
-        
-        if result.returncode == 0:
-            if os.path.exists(temp_exe):
-                os.remove(temp_exe)
-            return True, None
-        else:
-            error_msg = result.stderr.strip() if result.stderr else "Unknown compilation error"
-            if os.path.exists(temp_exe):
-                os.remove(temp_exe)
-            return False, error_msg
-            
-    except subprocess.TimeoutExpired:
-        if os.path.exists(temp_exe):
-            os.remove(temp_exe)
-        return False, f"Compilation timed out (exceeded {timeout} seconds)"
-        
-    except FileNotFoundError:
-        return False, "gcc compiler not found. Please install gcc/MinGW."
-        
-    except Exception as e:
-        if os.path.exists(temp_exe):
-            os.remove(temp_exe)
-        return False, f"Unexpected error: {str(e)}"
+        readable, _, _ = select.select([sock], [], [], 0)
+        # Readable with nothing to read means the peer closed the connection
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):
+        return True
 
 
-# =============================================================================
-# Main Grading Function
-# =============================================================================
-
-def grade_submissions(submissions_dir, config):
-    """
-    Grade all C file submissions in the given directory.
-    Returns detailed results for the frontend.
-    """
-    total_questions = config.get('totalQuestions', 6)
-    marks_per_question = config.get('marksPerQuestion', 2.5)
-    compilation_timeout = config.get('compilationTimeout', 60)
-    total_marks = total_questions * marks_per_question
-    
-    # Pre-process for UUID mapping
-    file_mapping = preprocess_files(submissions_dir, total_questions)
-    
-    # Data structures
-    student_files = defaultdict(lambda: defaultdict(list))
-    parsing_errors = []
-    error_log = []
-    
-    # Get all C files
-    try:
-        all_files = os.listdir(submissions_dir)
-    except FileNotFoundError:
-        return {
-            'success': False,
-            'error': f'Directory not found: {submissions_dir}'
-        }
-    
-    c_files = [f for f in all_files if f.lower().endswith('.c')]
-    
-    if not c_files:
-        return {
-            'success': False,
-            'error': 'No .c files found in the uploaded files'
-        }
-    
-    # Process each file
-    compiled_ok = 0
-    compiled_fail = 0
-    
-    for filename in sorted(c_files):
-        filepath = os.path.join(submissions_dir, filename)
-        
-        student_name, question_num, sub_part = parse_filename_enhanced(
-            filename, file_mapping, total_questions
-        )
-        
-        if student_name is None or question_num is None:
-            parsing_errors.append(filename)
-            continue
-        
-        # Compile the file
-        success, error_msg = compile_c_file(filepath, compilation_timeout)
-        
-        student_files[student_name][question_num].append({
-            'filename': filename,
-            'sub_part': sub_part,
-            'compiled': success,
-            'error': error_msg
-        })
-        
-        if success:
-            compiled_ok += 1
-        else:
-            compiled_fail += 1
-            error_log.append({
-                'student': student_name,
-                'question': question_num,
-                'filename': filename,
-                'message': error_msg[:500] if error_msg else 'Unknown error'
-            })
-    
-    # Calculate grades
-    student_grades = {}
-    students_with_errors = 0
-    
-    for student_name in sorted(student_files.keys()):
-        student_grades[student_name] = {q: 0.0 for q in range(1, total_questions + 1)}
-        has_errors = False
-        
-        for q_num in range(1, total_questions + 1):
-            files = student_files[student_name][q_num]
-            
-            if not files:
-                continue
-            
-            all_compiled = all(f['compiled'] for f in files)
-            
-            if all_compiled:
-                student_grades[student_name][q_num] = marks_per_question
-            else:
-                has_errors = True
-        
-        if has_errors:
-            students_with_errors += 1
-    
-    # Format results for frontend
-    students_list = []
-    all_totals = []
-    
-    for student_name in sorted(student_grades.keys()):
-        grades = student_grades[student_name]
-        total = sum(grades.values())
-        all_totals.append(total)
-        
-        questions = [grades[q] for q in range(1, total_questions + 1)]
-        students_list.append({
-            'name': student_name,
-            'questions': questions,
-            'total': total
-        })
-    
-    # Calculate statistics
-    avg_score = sum(all_totals) / len(all_totals) if all_totals else 0
-    max_score = max(all_totals) if all_totals else 0
-    min_score = min(all_totals) if all_totals else 0
-    perfect_scores = sum(1 for t in all_totals if t == total_marks)
-    
-    # Grade distribution
-    score_counts = defaultdict(int)
-    for t in all_totals:
-        score_counts[t] += 1
-    
-    distribution = [
-        {'score': score, 'count': count}
-        for score, count in sorted(score_counts.items(), reverse=True)
-    ]
-    
-    return {
-        'success': True,
-        'totalStudents': len(student_grades),
-        'totalFiles': len(c_files),
-        'compiledOk': compiled_ok,
-        'compiledFail': compiled_fail,
-        'parsingErrors': len(parsing_errors),
-        'averageScore': round(avg_score, 2),
-        'highestScore': max_score,
-        'lowestScore': min_score,
-        'perfectScores': perfect_scores,
-        'studentsWithErrors': students_with_errors,
-        'students': students_list,
-        'distribution': distribution,
-        'errorLog': error_log,
-        'totalMarks': total_marks
-    }
+@app.after_request
+def gzip_json(response):
+    """Gzip JSON responses for clients that accept it"""
+    if (response.mimetype != 'application/json'
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 
 # =============================================================================
@@ -497,6 +110,12 @@ def health_check():
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/grade', methods=['POST'])
 def grade():
     """Main grading endpoint"""
@@ -506,7 +125,8 @@ def grade():
         if not data:
             return jsonify({'success': False, 'error': 'No data provided'}), 400
         
-        session_dir = data.get('sessionDir')
+        # Either an upload directory or a zip/tar archive of submissions
+        session_dir = data.get('sessionDir') or data.get('archivePath')
         config = data.get('config', DEFAULT_CONFIG)
         
         if not session_dir:
@@ -515,11 +135,51 @@ def grade():
         if not os.path.exists(session_dir):
             return jsonify({'success': False, 'error': f'Directory not found: {session_dir}'}), 400
         
+        if data.get('archivePath') and not is_archive(session_dir):
+            return jsonify({'success': False, 'error': f'Not a zip or tar archive: {session_dir}'}), 400
+        
         # Merge with defaults
         full_config = {**DEFAULT_CONFIG, **config}
         
-        # Run grading
-        results = grade_submissions(session_dir, full_config)
+        # Coordinator mode: shard the session across worker processes
+        workers = GRADER_WORKERS
+        if data.get('workers') is not None:
+            try:
+                workers = _requested_workers(data['workers'])
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+        grade_fn = grade_submissions
+        if workers:
+            def grade_fn(submissions_dir, config, progress=None):
+                return grade_distributed(submissions_dir, config, workers, progress)
+        
+        # Store mode: keep the rows server-side and return only the summary
+        if data.get('store'):
+            grade_rows = grade_fn
+            
+            def grade_fn(submissions_dir, config, progress=None):
+                results = grade_rows(submissions_dir, config, progress=progress)
+                if not results.get('success', False):
+                    return results
+                return RESULTS.put(results, error_records(results)).summary
+        
+        # Async mode: return a job id right away and grade in the background
+        if data.get('async'):
+            job = JOBS.start(session_dir, full_config, grade_fn)
+            return jsonify({
+                'success': True,
+                'jobId': job.id,
+                'statusUrl': f'/jobs/{job.id}',
+                'eventsUrl': f'/jobs/{job.id}/events'
+            }), 202
+        
+        # Run grading on a worker thread, and cancel it if the client goes away
+        job = GradingJob(session_dir, full_config)
+        threading.Thread(target=job.run, args=(grade_fn,), daemon=True).start()
+        while not job.wait(timeout=DISCONNECT_POLL_SECONDS):
+            if not job.cancel_requested and _client_disconnected():
+                job.cancel()
+        results = job.result
         
         if not results.get('success', False):
             return jsonify(results), 400
@@ -534,6 +194,250 @@ def grade():
         }), 500
 
 
+class _RecordCollector:
+    """progress object that keeps every per-file record and can cancel the run"""
+    
+    def __init__(self):
+        self.records = []
+        self.session = None
+        self.cancel_requested = False
+        self._lock = threading.Lock()
+    
+    def set_total(self, total):
+        pass
+    
+    def file_done(self, record):
+        with self._lock:
+            self.records.append(record)
+    
+    def attach_session(self, session):
+        with self._lock:
+            self.session = session
+            cancel = self.cancel_requested
+        if cancel:
+            session.cancel()
+    
+    def cancel(self):
+        with self._lock:
+            self.cancel_requested = True
+            session = self.session
+        if session is not None:
+            session.cancel()
+
+
+@app.route('/shard', methods=['POST'])
+def grade_shard():
+    """Worker endpoint: grade base64-encoded sources sent by a coordinator"""
+    try:
+        data = request.get_json()
+        
+        if not data or not data.get('sources'):
+            return jsonify({'success': False, 'error': 'No sources provided'}), 400
+        
+        sources = {name: base64.b64decode(src) for name, src in data['sources'].items()}
+        full_config = {**DEFAULT_CONFIG, **data.get('config', {})}
+        
+        # Grade on a worker thread, and cancel it if the coordinator aborts the request
+        collector = _RecordCollector()
+        pool = ThreadPoolExecutor(max_workers=1)
+        future = pool.submit(grade_submissions, sources, full_config, progress=collector)
+        pool.shutdown(wait=False)
+        while wait([future], timeout=DISCONNECT_POLL_SECONDS).not_done:
+            if not collector.cancel_requested and _client_disconnected():
+                collector.cancel()
+        results = future.result()
+        
+        if not results.get('success', False):
+            return jsonify(results), 400
+        
+        results['files'] = collector.records
+        return jsonify(results)
+        
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Progress of an async grading job; includes the result once finished"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown job: {job_id}'}), 404
+    
+    return jsonify(job.status_dict(include_result=True))
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel an async grading job: files not yet compiled are skipped"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown job: {job_id}'}), 404
+    
+    if not job.cancel():
+        return jsonify({'success': False, 'error': f'Job already {job.status}: {job_id}'}), 409
+    
+    return jsonify({'success': True, 'jobId': job_id, 'status': 'cancelling'})
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events: one 'file' event per compiled file, then 'end'"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown job: {job_id}'}), 404
+    
+    return Response(
+        stream_with_context(job.stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+@app.route('/results/<result_id>', methods=['GET'])
+def result_summary(result_id):
+    """Summary statistics of a stored result, without student rows or errors"""
+    stored = RESULTS.get(result_id)
+    if stored is None:
+        return jsonify({'success': False, 'error': f'Unknown or expired result: {result_id}'}), 404
+    return jsonify(stored.summary)
+
+
+@app.route('/results/<result_id>/students', methods=['GET'])
+def result_students(result_id):
+    """Paginated, sorted and filtered student rows of a stored result"""
+    stored = RESULTS.get(result_id)
+    if stored is None:
+        return jsonify({'success': False, 'error': f'Unknown or expired result: {result_id}'}), 404
+    
+    try:
+        return jsonify(stored.students(
+            page=request.args.get('page', 1, type=int),
+            page_size=request.args.get('pageSize', 50, type=int),
+            sort=request.args.get('sort', 'name'),
+            order=request.args.get('order', 'asc'),
+            errors=request.args.get('errors'),
+            score_at_least=_float_arg('scoreAtLeast'),
+            score_below=_float_arg('scoreBelow'),
+            search=request.args.get('search')
+        ))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/results/<result_id>/errors', methods=['GET'])
+def result_errors(result_id):
+    """Paginated error records of a stored result"""
+    stored = RESULTS.get(result_id)
+    if stored is None:
+        return jsonify({'success': False, 'error': f'Unknown or expired result: {result_id}'}), 404
+    
+    try:
+        return jsonify(stored.error_records(
+            page=request.args.get('page', 1, type=int),
+            page_size=request.args.get('pageSize', 50, type=int),
+            student=request.args.get('student'),
+            question=request.args.get('question', type=int),
+            status=request.args.get('status')
+        ))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/diagnostics/<diagnostics_id>', methods=['GET'])
+def diagnostics_clusters(diagnostics_id):
+    """Every error cluster of a run graded with errorClusters, with all of its files"""
+    diagnostics = DIAGNOSTICS.get(diagnostics_id)
+    if diagnostics is None:
+        return jsonify({'success': False, 'error': f'Unknown or expired diagnostics: {diagnostics_id}'}), 404
+    
+    return jsonify({
+        'diagnosticsId': diagnostics.id,
+        'clusters': diagnostics.clusters(samples=None)
+    })
+
+
+@app.route('/diagnostics/<diagnostics_id>/files/<path:filename>', methods=['GET'])
+def diagnostics_file(diagnostics_id, filename):
+    """Full compiler output of one failed file"""
+    diagnostics = DIAGNOSTICS.get(diagnostics_id)
+    if diagnostics is None:
+        return jsonify({'success': False, 'error': f'Unknown or expired diagnostics: {diagnostics_id}'}), 404
+    
+    entry = diagnostics.text(filename)
+    if entry is None:
+        return jsonify({'success': False, 'error': f'No diagnostics for file: {filename}'}), 404
+    
+    return jsonify(entry)
+
+
+@app.route('/history/runs', methods=['GET'])
+def history_runs():
+    """Past runs, newest first, optionally for one course/section/assignment"""
+    try:
+        runs = HISTORY.runs(
+            course=request.args.get('course'),
+            section=request.args.get('section'),
+            assignment=request.args.get('assignment'),
+            limit=request.args.get('limit', 50, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'runs': runs})
+
+
+@app.route('/history/runs/<run_id>', methods=['GET'])
+def history_run(run_id):
+    """One past run: config, summary, student scores and file outcomes"""
+    run = HISTORY.run(run_id)
+    if run is None:
+        return jsonify({'success': False, 'error': f'Unknown run: {run_id}'}), 404
+    return jsonify({'success': True, **run})
+
+
+@app.route('/history/students/<path:student>', methods=['GET'])
+def history_student(student):
+    """A student's scores across past runs, oldest first"""
+    try:
+        scores = HISTORY.student_scores(
+            student,
+            course=request.args.get('course'),
+            limit=request.args.get('limit', 100, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'student': student, 'runs': scores})
+
+
+@app.route('/history/failure-rate', methods=['GET'])
+def history_failure_rate():
+    """Share of a section's files that failed to compile, per run"""
+    course = request.args.get('course')
+    section = request.args.get('section')
+    if not course or not section:
+        return jsonify({'success': False, 'error': 'course and section are required'}), 400
+    
+    try:
+        runs = HISTORY.failure_rate(course, section, limit=request.args.get('limit', 100, type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'courseName': course, 'sectionName': section, 'runs': runs})
+
+
 @app.route('/test-parse', methods=['POST'])
 def test_parse():
     """Test filename parsing"""
@@ -542,35 +446,73 @@ def test_parse():
         filename = data.get('filename', '')
         total_questions = data.get('totalQuestions', 6)
         
-        student, question, sub_part = parse_filename(filename, total_questions)
+        student, question, sub_part, rule = match_filename(filename, total_questions)
         
         return jsonify({
             'filename': filename,
             'student': student,
             'question': question,
-            'subPart': sub_part
+            'subPart': sub_part,
+            'rule': rule
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/resolve-filenames', methods=['POST'])
+def resolve_filenames_preview():
+    """Preview how a whole session's filenames will be mapped, without compiling"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filenames = data.get('filenames')
+        if not isinstance(filenames, list) or not all(isinstance(f, str) for f in filenames):
+            return jsonify({'success': False, 'error': 'filenames must be a list of strings'}), 400
+        
+        total_questions = data.get('totalQuestions', DEFAULT_CONFIG['totalQuestions'])
+        if isinstance(total_questions, bool) or not isinstance(total_questions, int) or total_questions < 1:
+            return jsonify({'success': False, 'error': 'totalQuestions must be an integer of at least 1'}), 400
+        
+        preview = resolve_filenames(filenames, total_questions)
+        return jsonify({'success': True, **preview})
+        
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 # =============================================================================
 # Main Entry Point
 # =============================================================================
 
 if __name__ == '__main__':
+    port = int(os.environ.get('GRADER_PORT', 8000))
     print("""
     ╔═══════════════════════════════════════════════════════════╗
     ║                                                           ║
     ║   🐍 Python Grading API                                   ║
     ║                                                           ║
-    ║   Server running on: http://localhost:8000                ║
+    ║   Server running on: http://localhost:{port:<20}║
     ║   Endpoints:                                              ║
     ║     GET  /health     - Health check                       ║
+    ║     GET  /metrics    - Prometheus metrics                 ║
     ║     POST /grade      - Grade submissions                  ║
+    ║     POST /shard      - Grade a shard (worker mode)        ║
+    ║     GET  /jobs/<id>  - Async grading job status           ║
+    ║     DELETE /jobs/<id> - Cancel an async grading job       ║
+    ║     GET  /jobs/<id>/events - Async job event stream       ║
+    ║     GET  /results/<id>[/students|/errors] - Stored result ║
+    ║     GET  /diagnostics/<id>[/files/<name>] - Full errors   ║
+    ║     GET  /history/runs[/<id>] - Past grading runs         ║
+    ║     GET  /history/students/<name> - A student's scores    ║
+    ║     GET  /history/failure-rate - Section failure rate     ║
     ║     POST /test-parse - Test filename parsing              ║
+    ║     POST /resolve-filenames - Preview a session's mapping ║
     ║                                                           ║
     ╚═══════════════════════════════════════════════════════════╝
-    """)
+    """.format(port=port))
     
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    threading.Thread(target=PCH_STORE.warmup, daemon=True).start()
+    app.run(host='0.0.0.0', port=port, debug=True)
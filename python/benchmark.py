@@ -0,0 +1,280 @@
+"""
+Benchmark suite for filename parsing and end-to-end grading.
+
+Generates a synthetic submissions directory (N students x totalQuestions,
+spread over every naming convention the parser handles, with a share of files
+that do not compile), then times:
+  - match_filename throughput (memo cache cleared, so every name is parsed)
+  - preprocess_files on the whole directory
+  - grade_submissions wall time
+
+Results are written as JSON so runs can be compared between versions:
+
+    python benchmark.py --students 300 --output before.json
+    python benchmark.py --students 300 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import grader
+from compile_cache import gcc_version
+
+GOOD_SOURCE = """#include <stdio.h>
+
+int main() {
+    int n = %d;
+    printf("%%d\\n", n * n);
+    return 0;
+}
+"""
+
+BAD_SOURCE = """#include <stdio.h>
+
+int main() {
+    int n = %d
+    printf("%%d\\n", n * n);
+    return 0;
+}
+"""
+
+# One generator per naming convention: (student, question) -> question part
+NAMING_CONVENTIONS = {
+    'assignment-dash': lambda q: f"A-2-{q}",
+    'c-number': lambda q: f"C{q}",
+    'p-number': lambda q: f"P{q}",
+    'ans-number': lambda q: f"2)ans {q}",
+    'ans-number-part': lambda q: f"2)ans {q} part 2",
+    'number-dot-zero': lambda q: f"{q}.0",
+    'untitled': lambda q: f"Untitled{q}",
+    'main-dash': lambda q: f"main-{q}",
+    'assignment-misspelled': lambda q: f"Assighnment2.{q}",
+    'course-code': lambda q: f"cse115-{q} no",
+    'no-number': lambda q: f"No{q}",
+    'digit-letter': lambda q: f"{q}a",
+    'question': lambda q: f"question {q}",
+    'problem': lambda q: f"problem-{q}",
+    'assignment': lambda q: f"assignment {q}",
+    'q-number': lambda q: f"Q-{q}",
+    'a-number': lambda q: f"a{q}",
+    'last-number-letter': lambda q: f"{q}-b",
+    'last-number-suffix': lambda q: f"{q}-1",
+    'last-number': lambda q: f"{q}",
+    'number-paren-letter': lambda q: f"{q}(b)",
+    # UUID-style names are placed by preprocess_files' submission-order fallback.
+    # The prefix keeps a hex part like "_a1..." or "_c2..." away from the rules.
+    'uuid-fallback': lambda q: f"uuid-{random.getrandbits(32):08x}-{random.getrandbits(16):04x}",
+}
+
+# Rules an earlier FILENAME_RULES entry always matches first: their names
+# parse, but are reported under the earlier rule
+SHADOWED_RULES = {
+    'ans-number-part': 'ans-number',
+    'last-number': 'last-number-suffix',
+}
+
+
+def check_conventions(total_questions):
+    """
+    Make sure every FILENAME_RULES entry has a generator, that each
+    generator's names are matched by the rule it is named after (or the rule
+    shadowing it), and that uuid-fallback names match no rule at all.
+    """
+    rules = [rule.name for rule in grader.FILENAME_RULES]
+    missing = [name for name in rules if name not in NAMING_CONVENTIONS]
+    if missing:
+        raise AssertionError(f"No naming convention generates: {', '.join(missing)}")
+    for name in rules:
+        expected = SHADOWED_RULES.get(name, name)
+        for q in range(1, total_questions + 1):
+            filename = f"student00000_0_100000_{NAMING_CONVENTIONS[name](q)}.c"
+            rule = grader.match_filename(filename, total_questions)[3]
+            if rule != expected:
+                raise AssertionError(f"{filename} is matched by '{rule}', not '{expected}'")
+    for _ in range(1000):
+        filename = f"student00000_0_100000_{NAMING_CONVENTIONS['uuid-fallback'](1)}.c"
+        rule = grader.match_filename(filename, total_questions)[3]
+        if rule is not None:
+            raise AssertionError(f"uuid-fallback name {filename} is matched by '{rule}'")
+
+
+def generate_corpus(target_dir, students, total_questions, fail_ratio=0.2, seed=1):
+    """
+    Write students x total_questions .c files into target_dir.
+    Student i uses naming convention i mod len(NAMING_CONVENTIONS).
+    Returns the list of filenames written.
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    conventions = list(NAMING_CONVENTIONS.values())
+    filenames = []
+
+    for i in range(students):
+        student = f"student{i:05d}"
+        make_name = conventions[i % len(conventions)]
+        for q in range(1, total_questions + 1):
+            submission_id = 100000 + i * total_questions + q
+            filename = f"{student}_{i}_{submission_id}_{make_name(q)}.c"
+            template = BAD_SOURCE if rng.random() < fail_ratio else GOOD_SOURCE
+            with open(os.path.join(target_dir, filename), 'w') as f:
+                f.write(template % (i * total_questions + q))
+            filenames.append(filename)
+
+    return filenames
+
+
+def _timed(func, repeat):
+    """Run func repeat times; returns (last result, list of wall times)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return result, times
+
+
+def _summary(times):
+    return {
+        'min': round(min(times), 6),
+        'median': round(statistics.median(times), 6),
+        'max': round(max(times), 6),
+        'runs': len(times)
+    }
+
+
+def bench_parse(filenames, total_questions, repeat):
+    def run():
+        grader.match_filename.cache_clear()
+        return sum(1 for f in filenames if grader.match_filename(f, total_questions)[1] is not None)
+
+    parsed, times = _timed(run, repeat)
+    return {
+        'files': len(filenames),
+        'parsed': parsed,
+        'seconds': _summary(times),
+        'filesPerSecond': round(len(filenames) / statistics.median(times), 1)
+    }
+
+
+def bench_preprocess(corpus_dir, total_questions, repeat):
+    def run():
+        grader.match_filename.cache_clear()
+        return grader.preprocess_files(corpus_dir, total_questions)
+
+    mapping, times = _timed(run, repeat)
+    return {'fallbackFiles': len(mapping), 'seconds': _summary(times)}
+
+
+def bench_grade(corpus_dir, config, repeat):
+    def run():
+        grader.match_filename.cache_clear()
+        return grader.grade_submissions(corpus_dir, config)
+
+    result, times = _timed(run, repeat)
+    return {
+        'totalFiles': result.get('totalFiles'),
+        'compiledOk': result.get('compiledOk'),
+        'compiledFail': result.get('compiledFail'),
+        'parsingErrors': result.get('parsingErrors'),
+        'seconds': _summary(times),
+        'filesPerSecond': round(result.get('totalFiles', 0) / statistics.median(times), 1)
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(current, baseline):
+    """Median-time ratios (current / baseline) for each benchmark stage"""
+    ratios = {}
+    for stage in ('parse', 'preprocess', 'grade'):
+        if stage in current and stage in baseline:
+            before = baseline[stage]['seconds']['median']
+            after = current[stage]['seconds']['median']
+            ratios[stage] = round(after / before, 3) if before else None
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100, help='number of synthetic students')
+    parser.add_argument('--questions', type=int, default=6, help='totalQuestions per student')
+    parser.add_argument('--fail-ratio', type=float, default=0.2, help='share of files that do not compile')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark (median is reported)')
+    parser.add_argument('--grade-repeat', type=int, default=1, help='runs of the full grade_submissions benchmark')
+    parser.add_argument('--skip-grade', action='store_true', help='only benchmark parsing')
+    parser.add_argument('--config', type=json.loads, default={},
+                        help='JSON overrides for the grading config, e.g. \'{"compileMode": "syntax"}\'')
+    parser.add_argument('--keep', metavar='DIR', help='generate the corpus into DIR and keep it')
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    parser.add_argument('--compare', metavar='BASELINE', help='previous results JSON to compare against')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    config = {**grader.DEFAULT_CONFIG, 'totalQuestions': args.questions, 'useCompileCache': False,
+              'history': False, **args.config}
+    check_conventions(args.questions)
+
+    corpus_dir = args.keep or tempfile.mkdtemp(prefix='grader-bench-')
+    os.makedirs(corpus_dir, exist_ok=True)
+    try:
+        filenames = generate_corpus(corpus_dir, args.students, args.questions, args.fail_ratio, args.seed)
+
+        results = {
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'gcc': gcc_version(),
+            'cpus': os.cpu_count(),
+            'corpus': {
+                'students': args.students,
+                'questions': args.questions,
+                'files': len(filenames),
+                'failRatio': args.fail_ratio,
+                'conventions': list(NAMING_CONVENTIONS)
+            },
+            'config': config,
+            'parse': bench_parse(filenames, args.questions, args.repeat),
+            'preprocess': bench_preprocess(corpus_dir, args.questions, args.repeat)
+        }
+        if not args.skip_grade:
+            results['grade'] = bench_grade(corpus_dir, config, args.grade_repeat)
+    finally:
+        if not args.keep:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            results['comparison'] = compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
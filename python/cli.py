@@ -0,0 +1,170 @@
+"""
+Headless batch grading for cron jobs and CI.
+
+Grades one or more submission directories (or zip/tar archives) without the
+web server; several directories are graded at once and still share the
+process-wide gcc slot limit. Flask is never imported. For each input NAME the
+output directory receives NAME.json (the full /grade result) and/or NAME.csv
+(one row per student) plus NAME_errors.csv (compile errors).
+
+    python cli.py section10/ section11.zip --output-dir results/
+    python cli.py uploads/* --config '{"totalQuestions": 5}' --format csv
+
+Exit status is a bitmask, so CI can gate on what went wrong:
+    0  every input graded, nothing to report
+    1  an input could not be graded (missing, no .c files, bad config)
+    2  some filenames could not be resolved to a student/question
+    4  some files did not compile
+--fail-on selects which of 2 and 4 count (default: both).
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grader
+
+EXIT_ERROR = 1
+EXIT_PARSE = 2
+EXIT_COMPILE = 4
+
+
+def output_name(path, taken):
+    """Output file stem for an input path, unique among taken"""
+    base = os.path.basename(os.path.normpath(path)) or 'submissions'
+    for ext in ('.tar.gz', '.tgz', '.zip', '.tar'):
+        if base.lower().endswith(ext):
+            base = base[:-len(ext)]
+            break
+    name = base
+    n = 2
+    while name in taken:
+        name = f"{base}_{n}"
+        n += 1
+    taken.add(name)
+    return name
+
+
+def write_json(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+def write_csv(path, results, config):
+    """Grades in the same layout as the Excel report"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Student Name', *[f"Q{q}" for q in range(1, config['totalQuestions'] + 1)], 'Total Score'])
+        for student in results.get('students', []):
+            writer.writerow([student['name'], *student['questions'], student['total']])
+
+
+def write_errors_csv(path, results):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Student Name', 'Question', 'File Name', 'Status', 'Error Message'])
+        for entry in grader.error_records(results):
+            writer.writerow([entry['student'], entry['question'], entry['filename'], entry.get('status', ''), entry['message']])
+
+
+def exit_status(results, fail_on):
+    """Exit bits for one input's result"""
+    if not results.get('success', False):
+        return EXIT_ERROR
+    status = 0
+    if 'parse' in fail_on and results.get('parsingErrors'):
+        status |= EXIT_PARSE
+    if 'compile' in fail_on and results.get('compiledFail'):
+        status |= EXIT_COMPILE
+    return status
+
+
+def grade_one(path, config):
+    """Grade one input; errors become an unsuccessful result"""
+    started = time.perf_counter()
+    if not os.path.exists(path):
+        results = {'success': False, 'error': f'Directory not found: {path}'}
+    else:
+        try:
+            results = grader.grade_submissions(path, config)
+        except Exception as e:
+            results = {'success': False, 'error': f'{type(e).__name__}: {e}'}
+    return results, time.perf_counter() - started
+
+
+def summary_line(path, results, seconds):
+    if not results.get('success', False):
+        return f"{path}: ERROR {results.get('error')}"
+    line = (f"{path}: {results['totalStudents']} students, {results['totalFiles']} files, "
+            f"{results['compiledOk']} compiled, {results['compiledFail']} failed, "
+            f"{results['parsingErrors']} unparsed, average {results['averageScore']} "
+            f"({seconds:.1f}s)")
+    if results.get('partial'):
+        line += f" PARTIAL: {results['notGraded']} files not graded (time budget exceeded)"
+    return line
+
+
+def _load_config(args):
+    config = dict(grader.DEFAULT_CONFIG)
+    if args.config_file:
+        with open(args.config_file, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    config.update(args.config)
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', metavar='PATH', help='submission directories or zip/tar archives')
+    parser.add_argument('--output-dir', '-o', default='.', help='where result files are written (default: .)')
+    parser.add_argument('--format', default='json,csv',
+                        help='comma-separated output formats: json, csv (default: json,csv)')
+    parser.add_argument('--config', type=json.loads, default={},
+                        help='JSON overrides for the grading config, e.g. \'{"totalQuestions": 5}\'')
+    parser.add_argument('--config-file', help='JSON file with grading config overrides (applied before --config)')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help='inputs graded at once (default: up to 4)')
+    parser.add_argument('--fail-on', default='parse,compile',
+                        help='comma-separated: parse, compile, or none (default: parse,compile)')
+    parser.add_argument('--quiet', '-q', action='store_true', help='no per-input summary on stderr')
+    args = parser.parse_args(argv)
+
+    formats = {f.strip() for f in args.format.split(',') if f.strip()}
+    if not formats <= {'json', 'csv'}:
+        parser.error(f"unknown format(s): {', '.join(sorted(formats - {'json', 'csv'}))}")
+    fail_on = {f.strip() for f in args.fail_on.split(',') if f.strip()} - {'none'}
+    if not fail_on <= {'parse', 'compile'}:
+        parser.error(f"unknown --fail-on value(s): {', '.join(sorted(fail_on - {'parse', 'compile'}))}")
+
+    config = _load_config(args)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    taken = set()
+    names = [output_name(path, taken) for path in args.inputs]
+    jobs = max(1, args.jobs or min(len(args.inputs), 4))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        outcomes = list(pool.map(lambda path: grade_one(path, config), args.inputs))
+
+    status = 0
+    for path, name, (results, seconds) in zip(args.inputs, names, outcomes):
+        stem = os.path.join(args.output_dir, name)
+        if 'json' in formats:
+            write_json(stem + '.json', results)
+        if 'csv' in formats and results.get('success', False):
+            write_csv(stem + '.csv', results, config)
+            write_errors_csv(stem + '_errors.csv', results)
+        if not args.quiet:
+            print(summary_line(path, results, seconds), file=sys.stderr)
+        status |= exit_status(results, fail_on)
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
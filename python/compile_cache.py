@@ -0,0 +1,169 @@
+"""
+Content-addressed on-disk cache of gcc compile outcomes.
+
+Entries are keyed by a hash of the source bytes, the gcc command line and the
+gcc version, so an unchanged submission is never recompiled. Diagnostics are
+stored with the source path replaced by a placeholder, which lets the same
+source uploaded under another name or session reuse the entry.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from functools import lru_cache
+
+PATH_PLACEHOLDER = '\x00SRC\x00'
+
+
+@lru_cache(maxsize=1)
+def gcc_version():
+    """First line of `gcc --version`, or 'unknown' if gcc cannot be run"""
+    try:
+        result = subprocess.run(
+            ["gcc", "--version"],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        return result.stdout.splitlines()[0] if result.stdout else 'unknown'
+    except Exception:
+        return 'unknown'
+
+
+class CompileCache:
+    """
+    Size- and age-bounded cache of (success, stderr) compile outcomes.
+    Safe to share between threads; every entry is one small JSON file.
+    """
+
+    def __init__(self, cache_dir, max_entries=50000, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, source_bytes, command):
+        """Hash of source bytes + gcc command line + gcc version"""
+        h = hashlib.sha256()
+        h.update(gcc_version().encode())
+        h.update(b'\x00')
+        h.update('\x00'.join(command).encode())
+        h.update(b'\x00')
+        h.update(source_bytes)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key, filepath):
+        """Return (success, error_message) for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get('created', 0) > self.max_age:
+            return None
+
+        error_msg = entry.get('error')
+        if error_msg is not None:
+            error_msg = error_msg.replace(PATH_PLACEHOLDER, filepath)
+        return entry['success'], error_msg
+
+    def put(self, key, filepath, success, error_msg):
+        """Store a compile outcome; prunes the cache every 500 writes"""
+        path = self._path(key)
+        entry = {
+            'success': success,
+            'error': error_msg.replace(filepath, PATH_PLACEHOLDER) if error_msg else error_msg,
+            'created': time.time()
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            self._puts_since_prune += 1
+            should_prune = self._puts_since_prune >= 500
+            if should_prune:
+                self._puts_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def session(self):
+        """Per-request view of the cache that counts its own hits and misses"""
+        return CacheSession(self)
+
+    def prune(self):
+        """Drop expired entries, then the oldest ones beyond max_entries"""
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if now - mtime > self.max_age or name.endswith('.tmp'):
+                    _remove_quietly(path)
+                else:
+                    entries.append((mtime, path))
+
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                _remove_quietly(path)
+
+
+class CacheSession:
+    """Wraps a CompileCache and records hit/miss counts for one grading run"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, source_bytes, command):
+        return self.cache.key(source_bytes, command)
+
+    def get(self, key, filepath):
+        outcome = self.cache.get(key, filepath)
+        with self._lock:
+            if outcome is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return outcome
+
+    def put(self, key, filepath, success, error_msg):
+        self.cache.put(key, filepath, success, error_msg)
+
+    def to_dict(self):
+        total = self.hits + self.misses
+        return {
+            'enabled': True,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
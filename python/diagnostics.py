@@ -0,0 +1,170 @@
+"""
+Compressed compiler diagnostics, grouped by error signature.
+
+Most failing submissions fail the same few ways (a missing ';', an implicit
+declaration, conio.h not found), so sending every file's gcc output back in
+the /grade response mostly repeats itself. A DiagnosticSet keeps each failing
+file's full diagnostic zlib-compressed and groups the files by a normalized
+signature: the first error line with file paths, line/column numbers and
+quoted identifiers removed. The response carries one entry per signature
+(count plus a few sample files); the full text of any file is fetched on
+request from the DiagnosticStore.
+"""
+
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+# Sets are kept this long, and at most this many at once
+DIAGNOSTICS_TTL_SECONDS = 24 * 3600
+MAX_DIAGNOSTIC_SETS = 20
+
+SAMPLES_PER_CLUSTER = 3
+
+_ERROR_LINE = re.compile(r'((?:fatal )?error): (.+)|(undefined reference to .+)')
+_QUOTED = re.compile(r"‘[^’\n]*’|'[^'\n]*'|`[^'\n]*'")
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def _mask_quoted(match):
+    text = match.group(0)[1:-1]
+    # Keep quoted punctuation (expected ‘;’ before ‘}’), hide names and types
+    return '‘_’' if re.search(r'[A-Za-z_]', text) else f'‘{text}’'
+
+
+def signature(message):
+    """
+    Normalized signature of one file's diagnostic, e.g.
+    "error: implicit declaration of function ‘_’".
+    """
+    if not message:
+        return 'Unknown error'
+    for line in message.splitlines():
+        if line.startswith('collect2:'):
+            continue
+        match = _ERROR_LINE.search(line)
+        if match:
+            kind = f'{match.group(1)}: ' if match.group(1) else ''
+            text = match.group(2) or match.group(3)
+            break
+    else:
+        # Not gcc output: timeouts, resource limits, cancellations
+        text = next((line for line in message.splitlines() if line.strip()), message)
+        kind = ''
+    text = _QUOTED.sub(_mask_quoted, text)
+    text = _NUMBER.sub('N', text)
+    return kind + ' '.join(text.split())
+
+
+class DiagnosticSet:
+    """Full diagnostics of one grading run, clustered by signature"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created = time.time()
+        self.text_bytes = 0
+        self.stored_bytes = 0
+        self._files = {}
+        self._clusters = {}
+        self._lock = threading.Lock()
+
+    def add(self, student, question, filename, status, message):
+        """Record one failed file's full diagnostic"""
+        message = message or ''
+        compressed = zlib.compress(message.encode('utf-8', errors='replace'), 6)
+        key = signature(message)
+        ref = {'student': student, 'question': question, 'filename': filename}
+        with self._lock:
+            self._files[filename] = (student, question, status, key, compressed)
+            self.text_bytes += len(message)
+            self.stored_bytes += len(compressed)
+            cluster = self._clusters.get(key)
+            if cluster is None:
+                cluster = self._clusters[key] = {'signature': key, 'status': status, 'files': []}
+            cluster['files'].append(ref)
+
+    def clusters(self, samples=SAMPLES_PER_CLUSTER):
+        """
+        Clusters, largest first. Each lists its first `samples` files, or
+        all of them with samples=None.
+        """
+        field = 'samples' if samples is not None else 'files'
+        with self._lock:
+            clusters = sorted(self._clusters.values(), key=lambda c: (-len(c['files']), c['signature']))
+            return [
+                {
+                    'signature': c['signature'],
+                    'status': c['status'],
+                    'count': len(c['files']),
+                    'students': len({ref['student'] for ref in c['files']}),
+                    field: c['files'][:samples]
+                }
+                for c in clusters
+            ]
+
+    def summary(self):
+        """What the /grade response carries instead of the error log"""
+        return {
+            'diagnosticsId': self.id,
+            'files': len(self._files),
+            'textBytes': self.text_bytes,
+            'storedBytes': self.stored_bytes,
+            'clusters': self.clusters()
+        }
+
+    def files(self):
+        """(filename, student, question, status, message) of every file, in the order added"""
+        with self._lock:
+            entries = list(self._files.items())
+        return [
+            (filename, student, question, status, zlib.decompress(compressed).decode('utf-8'))
+            for filename, (student, question, status, key, compressed) in entries
+        ]
+
+    def text(self, filename):
+        """One file's full diagnostic, or None if that file has none"""
+        with self._lock:
+            entry = self._files.get(filename)
+        if entry is None:
+            return None
+        student, question, status, key, compressed = entry
+        return {
+            'filename': filename,
+            'student': student,
+            'question': question,
+            'status': status,
+            'signature': key,
+            'message': zlib.decompress(compressed).decode('utf-8')
+        }
+
+
+class DiagnosticStore:
+    """Thread-safe store of DiagnosticSets with a size cap and time-based expiry"""
+
+    def __init__(self, max_sets=MAX_DIAGNOSTIC_SETS, ttl=DIAGNOSTICS_TTL_SECONDS):
+        self.max_sets = max_sets
+        self.ttl = ttl
+        self._sets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, diagnostics):
+        with self._lock:
+            self._expire()
+            self._sets[diagnostics.id] = diagnostics
+            while len(self._sets) > self.max_sets:
+                self._sets.popitem(last=False)
+        return diagnostics
+
+    def get(self, diagnostics_id):
+        with self._lock:
+            self._expire()
+            return self._sets.get(diagnostics_id)
+
+    def _expire(self):
+        now = time.time()
+        expired = [did for did, diagnostics in self._sets.items() if now - diagnostics.created > self.ttl]
+        for did in expired:
+            del self._sets[did]
@@ -0,0 +1,2084 @@
+"""
+C Programming Autograder - grading core
+Filename parsing, compilation and grading, shared by the Flask API (app.py)
+and the command-line interface (cli.py). Nothing here imports Flask.
+"""
+
+import base64
+import cProfile
+import http.client
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import traceback
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache, wraps
+import urllib.parse
+import zipfile
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits
+    resource = None
+
+from admission import AdaptiveLimiter
+from compile_cache import CompileCache
+from diagnostics import DiagnosticSet, DiagnosticStore
+from history import HistoryStore
+from metrics import Registry
+from pch import PchStore
+from report import StreamingReport
+from rlimits import limited
+from scheduler import FairScheduler, SessionCancelled
+from similarity import Fingerprint, FingerprintStore, find_similar, fingerprint
+from testrunner import TestRunner, parse_test_cases, tests_for
+
+# Default configuration
+DEFAULT_CONFIG = {
+    'totalQuestions': 6,
+    'marksPerQuestion': 2.5,
+    'compilationTimeout': 60,
+    'timeBudget': None,  # wall-clock seconds for the whole session; None = no limit
+    'compileWorkers': None,  # None = one worker per CPU
+    'useCompileCache': True,
+    'compileMode': 'link',  # 'link', 'compile' or 'syntax'
+    'compileBatchSize': 1,  # files per gcc run in 'syntax' mode
+    'usePch': True,  # precompiled header for the common leading includes
+    'timings': False,  # add a per-phase 'timings' block to the result
+    'timingsTopN': 10,  # slowest files listed in 'timings'
+    'profile': False,  # run under cProfile and save the profile to disk
+    'priority': 1,  # share of gcc slots relative to other concurrent sessions
+    'testCases': {},  # {"3": [{"stdin": ..., "expectedStdout": ...}], "4a": [...]}
+    'testTimeout': 5,  # wall-clock seconds per test run
+    'testCpuSeconds': 2,  # CPU seconds per test run
+    'testMemoryMb': 256,  # address-space limit per test run
+    'similarity': False,  # rank similar pairs of files per question
+    'similarityThreshold': 0.7,  # minimum Jaccard similarity reported
+    'similarityHistory': False,  # save fingerprints, compare with earlier sections
+    'report': False,  # write the grade report while grading runs
+    'reportFormats': ['xlsx'],  # 'xlsx' and/or 'csv'
+    'reportDir': None,  # None = GRADER_REPORT_DIR or python/reports
+    'errorClusters': False,  # error clusters instead of 'errorLog'; full text kept server-side
+    'history': True,  # record the run in the history database
+    'courseName': 'CSE115',
+    'sectionName': 'Section 10',
+    'assignmentName': 'Assignment 2'
+}
+
+# Process-wide cap on concurrent gcc runs, shared by every /grade request.
+# Override with the GRADER_MAX_COMPILES environment variable. The number of
+# slots actually open adapts to load average and free memory below that cap.
+MAX_CONCURRENT_COMPILES = int(os.environ.get('GRADER_MAX_COMPILES') or os.cpu_count() or 1)
+_compile_slots = AdaptiveLimiter(MAX_CONCURRENT_COMPILES)
+
+# Resource limits applied to every gcc child (POSIX only). cc1, as and ld
+# inherit them, so each compiler stage gets its own CPU-time budget.
+COMPILE_LIMITS = {
+    'cpuSeconds': int(os.environ.get('GRADER_COMPILE_CPU_SECONDS', 30)),
+    'memoryMb': int(os.environ.get('GRADER_COMPILE_MEMORY_MB', 1024)),
+    'outputMb': int(os.environ.get('GRADER_COMPILE_OUTPUT_MB', 64))
+}
+
+# Where {"profile": true} runs save their cProfile output
+PROFILE_DIR = os.environ.get('GRADER_PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+
+# Metrics exposed in Prometheus text format on /metrics
+METRICS = Registry()
+COMPILE_SECONDS = METRICS.histogram(
+    'grader_compile_duration_seconds',
+    'Wall time of single-file gcc runs, by outcome status',
+    labels=('status',)
+)
+PARSE_SECONDS = METRICS.counter(
+    'grader_parse_seconds_total',
+    'Time spent resolving filenames to student/question'
+)
+PARSE_FILES = METRICS.counter(
+    'grader_parse_files_total',
+    'Filenames resolved to student/question'
+)
+FILES_GRADED = METRICS.counter(
+    'grader_files_graded_total',
+    'Files compiled and graded, by outcome status',
+    labels=('status',)
+)
+LAST_RUN_FILES_PER_SECOND = METRICS.gauge(
+    'grader_last_run_files_per_second',
+    'Throughput of the most recently finished grading run'
+)
+REQUESTS_IN_FLIGHT = METRICS.gauge(
+    'grader_requests_in_flight',
+    'Grading runs currently in progress (sync and async)'
+)
+PENDING_COMPILES = METRICS.gauge(
+    'grader_compile_pending',
+    'Files handed to the compile stage that have not finished yet'
+)
+QUEUE_WAIT_SECONDS = METRICS.histogram(
+    'grader_compile_queue_wait_seconds',
+    'Time compiles waited in the scheduler for a gcc slot'
+)
+METRICS.gauge(
+    'grader_compile_queue_depth',
+    'Compiles waiting for a gcc slot',
+    callback=lambda: SCHEDULER.waiting
+)
+METRICS.gauge(
+    'grader_compile_slots_active',
+    'gcc processes currently running',
+    callback=lambda: _compile_slots.active
+)
+METRICS.gauge(
+    'grader_compile_slots_limit',
+    'Concurrent gcc runs currently admitted by the adaptive limiter',
+    callback=lambda: _compile_slots.limit
+)
+CACHE_LOOKUPS = METRICS.counter(
+    'grader_compile_cache_lookups_total',
+    'Compile cache lookups, by result',
+    labels=('result',)
+)
+METRICS.gauge(
+    'grader_compile_cache_hit_ratio',
+    'Share of compile cache lookups that were hits since start',
+    callback=lambda: _ratio(CACHE_LOOKUPS.value(result='hit'), CACHE_LOOKUPS.value(result='miss'))
+)
+
+
+def _ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+# Every session's gcc runs go through one scheduler that shares the slots
+# fairly between concurrent sessions, weighted by config['priority']
+SCHEDULER = FairScheduler(_compile_slots, on_wait=QUEUE_WAIT_SECONDS.observe)
+
+
+# Precompiled headers for the common student includes, built on first use
+# and warmed up at server start
+PCH_STORE = PchStore(
+    os.environ.get('GRADER_PCH_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.pch_cache')
+)
+
+# Similarity fingerprints kept per course/assignment/section
+FINGERPRINT_STORE = FingerprintStore(
+    os.environ.get('GRADER_FINGERPRINT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fingerprints')
+)
+
+# Streamed grade reports, unless the config names a reportDir
+REPORT_DIR = os.environ.get('GRADER_REPORT_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports')
+
+# Full compiler diagnostics of runs graded with errorClusters
+DIAGNOSTICS = DiagnosticStore(max_sets=int(os.environ.get('GRADER_DIAGNOSTICS_MAX', 20)))
+
+# Config, file outcomes and scores of every run graded with 'history'
+HISTORY = HistoryStore(
+    os.environ.get('GRADER_HISTORY_DB') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.sqlite3')
+)
+
+# Persistent compile cache, shared by every /grade request
+COMPILE_CACHE = CompileCache(
+    os.environ.get('GRADER_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.compile_cache'),
+    max_entries=int(os.environ.get('GRADER_CACHE_MAX_ENTRIES', 50000)),
+    max_age_days=float(os.environ.get('GRADER_CACHE_MAX_AGE_DAYS', 30))
+)
+
+
+# =============================================================================
+# Filename Parser - Extracts student name and question number
+# =============================================================================
+
+# Each rule is (name, pattern, target, resolver). Rules are tried in order and
+# the first one whose resolver returns a question wins. `target` selects the
+# text the pattern runs against: 'base' (re.search over the lowercased name
+# without extension) or 'last' (re.match over the last underscore part).
+# Adding a naming convention means adding a row here.
+FilenameRule = namedtuple('FilenameRule', ['name', 'pattern', 'target', 'resolve'])
+
+
+def _question(match, total_questions):
+    """Group 1 is the question number, no sub-part"""
+    q_num = int(match.group(1))
+    if 1 <= q_num <= total_questions:
+        return q_num, None
+    return None
+
+
+def _question_sub(match, total_questions):
+    """Group 1 is the question number, optional group 2 the sub-part letter"""
+    q_num = int(match.group(1))
+    sub_part = match.group(2).lower() if match.group(2) else None
+    if 1 <= q_num <= total_questions:
+        return q_num, sub_part
+    return None
+
+
+def _question_part_number(match, total_questions):
+    """Group 2 is a numeric part (1 -> a, 2 -> b, ...)"""
+    q_num = int(match.group(1))
+    part_num = int(match.group(2))
+    sub_part = chr(ord('a') + part_num - 1) if part_num <= 26 else None
+    if 1 <= q_num <= total_questions:
+        return q_num, sub_part
+    return None
+
+
+def _untitled(match, total_questions):
+    """UntitledN past the last question becomes a sub-part of the last one"""
+    q_num = int(match.group(1))
+    if 1 <= q_num <= total_questions:
+        return q_num, None
+    elif q_num <= total_questions + 2:
+        return total_questions, chr(ord('a') + q_num - total_questions)
+    return None
+
+
+def _main_dash(match, total_questions):
+    """main-(N+1) is part b of the last question"""
+    q_num = int(match.group(1))
+    if 1 <= q_num <= total_questions:
+        return q_num, None
+    elif q_num == total_questions + 1:
+        return total_questions, 'b'
+    return None
+
+
+FILENAME_RULES = [
+    # Special patterns first (more specific)
+    FilenameRule('assignment-dash', re.compile(r'a-2-(\d+)([a-z])?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('c-number', re.compile(r'[_]c(\d+)', re.IGNORECASE), 'base', _question),
+    FilenameRule('p-number', re.compile(r'[_]p(\d+)\s*([a-z])?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('ans-number', re.compile(r'2\)ans\s*(\d+)', re.IGNORECASE), 'base', _question),
+    FilenameRule('ans-number-part', re.compile(r'2\)ans\s*(\d+)\s*part\s*(\d+)', re.IGNORECASE), 'base', _question_part_number),
+    FilenameRule('number-dot-zero', re.compile(r'[_](\d+)([a-z])?\.0', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('untitled', re.compile(r'untitled(\d+)', re.IGNORECASE), 'base', _untitled),
+    FilenameRule('main-dash', re.compile(r'main-(\d+)(?![a-f0-9\-])'), 'base', _main_dash),
+    FilenameRule('assignment-misspelled', re.compile(r'assig[hn]+ment2\.(\d+)([a-z])?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('course-code', re.compile(r'cse115-?(\d+)', re.IGNORECASE), 'base', _question),
+    FilenameRule('no-number', re.compile(r'no[_\-\s]?(\d+)([a-z])?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('digit-letter', re.compile(r'[_](\d)([a-z])(?:\.|\-|$)'), 'base', _question_sub),
+    # Standard patterns
+    FilenameRule('question', re.compile(r'question[_\-\s]*(\d+)\s*\(?([a-z])?\)?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('problem', re.compile(r'problem[_\-\s]*(\d+)', re.IGNORECASE), 'base', _question),
+    FilenameRule('assignment', re.compile(r'assignment[_\-\s]*(\d+)\s*[\-]?([a-z])?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('q-number', re.compile(r'q[_\-\s]?(\d+)\s*[\-]?\s*\(?([a-z])?\)?', re.IGNORECASE), 'base', _question_sub),
+    FilenameRule('a-number', re.compile(r'[_]a(\d+)', re.IGNORECASE), 'base', _question),
+    # Last underscore part on its own
+    FilenameRule('last-number-letter', re.compile(r'^(\d+)[_\-]?([a-z])$'), 'last', _question_sub),
+    FilenameRule('last-number-suffix', re.compile(r'^(\d+)[\-]?\d*$'), 'last', _question),
+    FilenameRule('last-number', re.compile(r'^(\d+)$'), 'last', _question),
+    # "X(a)" anywhere in the name
+    FilenameRule('number-paren-letter', re.compile(r'(\d)\(([a-z])\)'), 'base', _question_sub),
+]
+
+
+@lru_cache(maxsize=65536)
+def match_filename(filename, total_questions=6):
+    """
+    Parse the filename to extract student name and question number.
+    Results are memoized per (filename, total_questions).
+    
+    Returns: (student_name, question_number, sub_part, rule_name)
+    """
+    # Remove .c/.C extension
+    base_name = filename.lower().replace('.c', '')
+    original_base = filename.replace('.c', '').replace('.C', '')
+    
+    # Split by underscore
+    parts = original_base.split('_')
+    
+    if len(parts) < 2:
+        return None, None, None, None
+    
+    # Student name is always the first part (lowercase for consistency)
+    student_name = parts[0].lower()
+    last_part = parts[-1].lower()
+    
+    for rule in FILENAME_RULES:
+        if rule.target == 'last':
+            match = rule.pattern.match(last_part)
+        else:
+            match = rule.pattern.search(base_name)
+        if not match:
+            continue
+        resolved = rule.resolve(match, total_questions)
+        if resolved is not None:
+            return student_name, resolved[0], resolved[1], rule.name
+    
+    # No pattern matched
+    return student_name, None, None, None
+
+
+def parse_filename(filename, total_questions=6):
+    """
+    Parse the filename to extract student name and question number.
+    Handles multiple naming conventions from various students.
+    
+    Returns: (student_name, question_number, sub_part)
+    """
+    return match_filename(filename, total_questions)[:3]
+
+
+def preprocess_files(submissions_dir, total_questions=6):
+    """
+    Pre-process files to map UUID-named files to Q1-QN based on submission order.
+    Returns: {filename: (question_num, sub_part)}
+    """
+    # Get all C files
+    try:
+        all_files = os.listdir(submissions_dir)
+    except FileNotFoundError:
+        return {}
+        
+    c_files = [f for f in all_files if f.lower().endswith('.c')]
+    return map_unparsed_files(c_files, total_questions)
+
+
+def map_unparsed_files(c_files, total_questions=6):
+    """
+    Map the files parse_filename cannot place to Q1-QN by submission order.
+    Returns: {filename: (question_num, sub_part)}
+    """
+    file_mapping = {}
+    
+    # Group files by student
+    student_files_raw = defaultdict(list)
+    for f in c_files:
+        parts = f.split('_')
+        if len(parts) >= 3:
+            student = parts[0].lower()
+            try:
+                sub_id = int(parts[2])
+                student_files_raw[student].append((sub_id, f))
+            except:
+                student_files_raw[student].append((0, f))
+    
+    # Process each student's files
+    for student, files in student_files_raw.items():
+        files.sort(key=lambda x: x[0])
+        
+        unassigned_files = []
+        for sub_id, filename in files:
+            name, q_num, sub_part = parse_filename(filename, total_questions)
+            if q_num is None:
+                unassigned_files.append((sub_id, filename))
+        
+        for i, (sub_id, filename) in enumerate(unassigned_files):
+            if i < total_questions:
+                q_num = i + 1
+                file_mapping[filename] = (q_num, None)
+            else:
+                file_mapping[filename] = (total_questions, chr(ord('a') + i - total_questions + 1))
+    
+    return file_mapping
+
+
+def parse_filename_enhanced(filename, file_mapping, total_questions=6):
+    """Parse filename with fallback to pre-computed mapping"""
+    student_name, q_num, sub_part = parse_filename(filename, total_questions)
+    
+    if q_num is not None:
+        return student_name, q_num, sub_part
+    
+    if filename in file_mapping:
+        parts = filename.split('_')
+        student_name = parts[0].lower() if parts else None
+        q_num, sub_part = file_mapping[filename]
+        return student_name, q_num, sub_part
+    
+    return student_name, None, None
+
+
+def resolve_filenames(filenames, total_questions=6):
+    """
+    Resolve a whole session's filenames the way grade_submissions will,
+    submission-order fallback included, without compiling anything.
+    Returns: {'files', 'fallback', 'unparsed', 'collisions', 'ignored',
+              'duplicates', 'students'}
+    """
+    seen = set()
+    duplicates = []
+    ignored = []
+    c_files = []
+    for filename in filenames:
+        if filename in seen:
+            duplicates.append(filename)
+            continue
+        seen.add(filename)
+        if filename.lower().endswith('.c'):
+            c_files.append(filename)
+        else:
+            ignored.append(filename)
+    
+    file_mapping = map_unparsed_files(c_files, total_questions)
+    
+    files = []
+    fallback = []
+    unparsed = []
+    by_question = defaultdict(list)
+    for filename in sorted(c_files):
+        student_name, q_num, sub_part, rule = match_filename(filename, total_questions)
+        if q_num is None and filename in file_mapping:
+            student_name = filename.split('_')[0].lower()
+            q_num, sub_part = file_mapping[filename]
+            rule = 'submission-order'
+            fallback.append(filename)
+        elif q_num is None:
+            unparsed.append(filename)
+        
+        files.append({
+            'filename': filename,
+            'student': student_name if q_num is not None else None,
+            'question': q_num,
+            'subPart': sub_part,
+            'rule': rule
+        })
+        if q_num is not None:
+            by_question[(student_name, q_num)].append((sub_part, filename))
+    
+    # Files that will be graded together as one question, probably by mistake
+    collisions = []
+    for (student_name, q_num), entries in sorted(by_question.items()):
+        if len(entries) < 2:
+            continue
+        sub_parts = [sub_part for sub_part, _ in entries]
+        if len(set(sub_parts)) < len(sub_parts):
+            kind = 'duplicate'  # same sub-part (or none) more than once
+        elif None in sub_parts:
+            kind = 'mixed'  # a whole-question file next to sub-part files
+        else:
+            continue
+        collisions.append({
+            'student': student_name,
+            'question': q_num,
+            'kind': kind,
+            'files': [{'filename': filename, 'subPart': sub_part} for sub_part, filename in entries]
+        })
+    
+    return {
+        'files': files,
+        'fallback': fallback,
+        'unparsed': unparsed,
+        'collisions': collisions,
+        'ignored': ignored,
+        'duplicates': duplicates,
+        'students': len({student_name for student_name, _ in by_question})
+    }
+
+
+# =============================================================================
+# Archive Ingestion - reads submissions straight out of zip/tar exports
+# =============================================================================
+
+def is_archive(path):
+    """True if path is a zip or tar (optionally compressed) file"""
+    if not os.path.isfile(path):
+        return False
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def _archive_member_name(member_path):
+    """Base name of a .c member, or None for folders and macOS metadata"""
+    name = member_path.replace('\\', '/').rsplit('/', 1)[-1]
+    if not name.lower().endswith('.c') or name.startswith('._') or '__MACOSX/' in member_path:
+        return None
+    return name
+
+
+def read_archive_sources(archive_path):
+    """
+    Read every .c member of a zip/tar archive into memory, without
+    extracting anything to disk. Members are keyed by base name, since
+    LMS exports often nest files in per-student folders.
+    Returns: ({filename: source_bytes}, [duplicate filenames that were skipped])
+    """
+    sources = {}
+    duplicates = []
+    
+    def add(name, read):
+        if name in sources:
+            duplicates.append(name)
+        else:
+            sources[name] = read()
+    
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                name = _archive_member_name(info.filename)
+                if name and not info.is_dir():
+                    add(name, lambda: zf.read(info))
+    else:
+        # 'r|*' reads the tar as a forward-only stream, compressed or not
+        with tarfile.open(archive_path, 'r|*') as tf:
+            for member in tf:
+                name = _archive_member_name(member.name)
+                if name and member.isfile():
+                    add(name, lambda: tf.extractfile(member).read())
+    
+    return sources, duplicates
+
+
+# =============================================================================
+# Compilation Function
+# =============================================================================
+
+RESOURCE_LIMIT_PREFIX = "Resource limit exceeded"
+CANCELLED_MESSAGE = "Compilation cancelled (grading session was cancelled)"
+BUDGET_EXCEEDED_MESSAGE = "Not graded (time budget exceeded)"
+# Only lines written by the gcc driver or one of its stages count: gcc also
+# echoes the student's source under each diagnostic, and that text can say
+# anything ("Error: memory exhausted").
+_RESOURCE_LIMIT_PATTERN = re.compile(
+    r'^(?:\S*/)?(?:gcc|cc1|as|collect2|ld)[^:\n]*:(?!\d).*'
+    r'(?:CPU time limit exceeded|File size limit exceeded|File too large|Killed signal|'
+    r'out of memory allocating|virtual memory exhausted|memory exhausted|'
+    r'failed to map segment from shared object)',
+    re.MULTILINE
+)
+
+
+def _compile_limited(command):
+    """gcc command wrapped to run under COMPILE_LIMITS (see rlimits.py)"""
+    cpu = COMPILE_LIMITS['cpuSeconds']
+    memory = COMPILE_LIMITS['memoryMb'] * 1024 * 1024
+    output = COMPILE_LIMITS['outputMb'] * 1024 * 1024
+    # Soft CPU limit first so the stage gets SIGXCPU (and gcc names it)
+    return limited(command, {'cpu': (cpu, cpu + 1), 'as': (memory, memory), 'fsize': (output, output)})
+
+
+def _hit_resource_limit(returncode, stderr):
+    """True if gcc (or one of its stages) was stopped by a compile limit"""
+    if resource is None:
+        return False
+    if returncode < 0 and -returncode in (signal.SIGXCPU, signal.SIGXFSZ, signal.SIGKILL):
+        return True
+    return bool(stderr) and _RESOURCE_LIMIT_PATTERN.search(stderr) is not None
+
+
+def _run_compiler(command, input=None, timeout=60, text=False):
+    """
+    subprocess.run for gcc, in its own process group and tracked by the
+    current scheduler session, so cancelling the session kills gcc and its
+    cc1/as/ld children.
+    Raises SessionCancelled if it was killed that way.
+    """
+    session = SCHEDULER.current()
+    proc = subprocess.Popen(
+        _compile_limited(command),
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=text,
+        start_new_session=os.name != 'nt'
+    )
+    with session.track(proc):
+        try:
+            stdout, stderr = proc.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            if os.name != 'nt':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+            proc.communicate()
+            raise
+    if session.cancelled and proc.returncode < 0:
+        raise SessionCancelled(session.name)
+    return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
+
+
+def compile_status(success, error_msg):
+    """
+    Classify a compile outcome: 'compiled', 'error', 'timeout',
+    'resource_limit', 'cancelled' or 'not_graded' (time budget exceeded)
+    """
+    if success:
+        return 'compiled'
+    if error_msg == CANCELLED_MESSAGE:
+        return 'cancelled'
+    if error_msg == BUDGET_EXCEEDED_MESSAGE:
+        return 'not_graded'
+    if error_msg and error_msg.startswith(RESOURCE_LIMIT_PREFIX):
+        return 'resource_limit'
+    if error_msg and error_msg.startswith('Compilation timed out'):
+        return 'timeout'
+    return 'error'
+
+
+# Compile modes:
+#   link    - full compile and link into a temporary executable (the default)
+#   compile - compile to an object file discarded to /dev/null, no linking
+#   syntax  - parse and type-check only (-fsyntax-only), no code generation
+COMPILE_MODES = ('link', 'compile', 'syntax')
+
+
+# In-memory sources are compiled from a short-lived copy, on tmpfs if there is one
+SOURCE_COPY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+
+
+def compile_command(filepath, output, mode='link', include=None, language=None):
+    """
+    gcc command line used to compile filepath in the given mode.
+    language forces the source language ('c' for in-memory sources, whose
+    copies keep the original name); include is a precompiled header to
+    load first (see pch.py).
+    """
+    source = ["-x", language, filepath] if language else [filepath]
+    gcc = ["gcc", "-include", include] if include else ["gcc"]
+    if mode == 'syntax':
+        return [*gcc, "-fsyntax-only", *source]
+    if mode == 'compile':
+        return [*gcc, "-c", *source, "-o", os.devnull]
+    return [*gcc, *source, "-o", output]
+
+
+def _read_source(filepath):
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _cache_command(source, mode, pch):
+    """Command line a cache key is built from; PCH runs are keyed apart"""
+    if source is not None:
+        return compile_command('<copy>', '<out>', mode, '<pch>' if pch else None, language='c')
+    return compile_command('<src>', '<out>', mode, '<pch>' if pch else None)
+
+
+def _cache_lookup(filepath, cache, mode, source=None, content=None, pch=False):
+    """
+    Return (cache_key, cached_outcome); both None when there is no cache.
+    content is the file's bytes if the caller already read them.
+    """
+    if cache is None:
+        return None, None
+    if source is not None:
+        return _cache_probe(cache, source, _cache_command(source, mode, pch), filepath)
+    if content is None:
+        content = _read_source(filepath)
+    if content is None:
+        return None, None
+    return _cache_probe(cache, content, _cache_command(source, mode, pch), filepath)
+
+
+def _cache_probe(cache, source_bytes, command, filepath):
+    cache_key = cache.key(source_bytes, command)
+    return cache_key, cache.get(cache_key, filepath)
+
+
+def _run_gcc(filepath, timeout=60, mode='link', source=None, include=None, output=None):
+    """
+    Run gcc once on a single file, holding a compile slot, and record its
+    latency by outcome.
+    Returns: (success, error_message, decided) - see _invoke_gcc.
+    """
+    with SCHEDULER.slot():
+        started = time.perf_counter()
+        outcome = _invoke_gcc(filepath, timeout, mode, source, include, output)
+        COMPILE_SECONDS.observe(time.perf_counter() - started, status=compile_status(*outcome[:2]))
+    return outcome
+
+
+def _run_gcc_pch(filepath, timeout=60, mode='link', source=None, include=None, output=None):
+    """
+    _run_gcc with a precompiled header. gcc names the PCH's pch.h in notes
+    that point into a header ("In file included from ..."), so a failed
+    compile whose diagnostics mention it is rerun without the PCH and
+    reports what a plain compile prints.
+    """
+    outcome = _run_gcc(filepath, timeout, mode, source, include, output)
+    if include is None or outcome[0] or not outcome[2] or include not in (outcome[1] or ''):
+        return outcome
+    return _run_gcc(filepath, timeout, mode, source, None, output)
+
+
+@contextmanager
+def _source_copy(filepath, source):
+    """
+    Write in-memory source bytes to a private temporary directory under the
+    file's base name, so gcc can quote source lines in its diagnostics the
+    way it does for an uploaded file. Removed when the block ends.
+    """
+    directory = tempfile.mkdtemp(prefix='grader-', dir=SOURCE_COPY_DIR)
+    path = os.path.join(directory, os.path.basename(filepath) or 'source.c')
+    try:
+        with open(path, 'wb') as f:
+            f.write(source)
+        yield path
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _invoke_gcc(filepath, timeout=60, mode='link', source=None, include=None, output=None):
+    """
+    Run gcc once on a single file.
+    If source bytes are given they are compiled from a temporary copy (see
+    _source_copy) and filepath is only used to label the diagnostics.
+    If output is given ('link' mode), the executable is written there and
+    kept; the caller removes it.
+    Returns: (success, error_message, decided) where decided is False for
+    outcomes gcc did not actually reach (timeouts, missing gcc, ...).
+    """
+    temp_exe = None
+    if output is not None:
+        mode = 'link'
+    elif mode == 'link' and source is None:
+        base_name = os.path.splitext(os.path.basename(filepath))[0]
+        temp_exe = os.path.join(os.path.dirname(filepath), f"{base_name}_temp.exe")
+    
+    try:
+        if source is None:
+            result = _run_compiler(
+                compile_command(filepath, output or temp_exe, mode, include),
+                timeout=timeout,
+                text=True
+            )
+            stderr = result.stderr
+        else:
+            with _source_copy(filepath, source) as path:
+                result = _run_compiler(
+                    compile_command(path, output or os.devnull, mode, include, language='c'),
+                    timeout=timeout
+                )
+            stderr = result.stderr.decode(errors='replace').replace(path, filepath)
+        
+        if result.returncode == 0:
+            if temp_exe and os.path.exists(temp_exe):
+                os.remove(temp_exe)
+            return True, None, True
+        else:
+            error_msg = stderr.strip() if stderr else "Unknown compilation error"
+            if temp_exe and os.path.exists(temp_exe):
+                os.remove(temp_exe)
+            if _hit_resource_limit(result.returncode, stderr):
+                limits = (f"CPU {COMPILE_LIMITS['cpuSeconds']}s, memory {COMPILE_LIMITS['memoryMb']} MB, "
+                          f"output {COMPILE_LIMITS['outputMb']} MB")
+                return False, f"{RESOURCE_LIMIT_PREFIX} ({limits})\n{error_msg}", False
+            return False, error_msg, True
+            
+    except subprocess.TimeoutExpired:
+        if temp_exe and os.path.exists(temp_exe):
+            os.remove(temp_exe)
+        return False, f"Compilation timed out (exceeded {timeout} seconds)", False
+        
+    except FileNotFoundError:
+        return False, "gcc compiler not found. Please install gcc/MinGW.", False
+        
+    except SessionCancelled:
+        if temp_exe and os.path.exists(temp_exe):
+            os.remove(temp_exe)
+        raise
+        
+    except Exception as e:
+        if temp_exe and os.path.exists(temp_exe):
+            os.remove(temp_exe)
+        return False, f"Unexpected error: {str(e)}", False
+
+
+def compile_c_file(filepath, timeout=60, cache=None, mode='link', source=None, pch=None):
+    """
+    Attempt to compile a C file using gcc.
+    If a cache is given, an unchanged source is answered without running gcc.
+    If source bytes are given, gcc compiles a temporary copy of them instead
+    of filepath.
+    If a PCH session is given, a file whose leading includes have a
+    precompiled header is compiled with it.
+    Only 'link' mode on a real file writes (and then removes) an executable.
+    Returns: (success: bool, error_message: str or None)
+    """
+    content = source
+    if content is None and pch is not None:
+        content = _read_source(filepath)
+    
+    cache_key, cached = _cache_lookup(filepath, cache, mode, source, content, pch is not None)
+    if cached is not None:
+        return cached
+    
+    include = None
+    if pch is not None:
+        include = pch.header_for_source(content) if content is not None else None
+        pch.record(include is not None)
+    
+    success, error_msg, decided = _run_gcc_pch(filepath, timeout, mode, source, include)
+    
+    # Only outcomes that gcc actually decided are cached, never timeouts
+    if cache_key and decided:
+        cache.put(cache_key, filepath, success, error_msg)
+    return success, error_msg
+
+
+def compile_and_test(filepath, cases, runner, timeout=60, cache=None, source=None, pch=None):
+    """
+    Link a C file into the runner's working directory and run its test
+    cases against that binary, then remove it.
+    A cached outcome has no binary to run, so gcc always runs here; the
+    outcome is still written to the cache for later compile-only runs.
+    Returns: ((success, error_message), test_results or None if it did not compile)
+    """
+    content = source if source is not None else _read_source(filepath)
+    
+    include = None
+    if pch is not None:
+        include = pch.header_for_source(content) if content is not None else None
+        pch.record(include is not None)
+    
+    binary = runner.binary_path()
+    success, error_msg, decided = _run_gcc_pch(filepath, timeout, 'link', source, include, binary)
+    
+    if cache is not None and content is not None and decided:
+        command = _cache_command(source, 'link', pch is not None)
+        cache.put(cache.key(content, command), filepath, success, error_msg)
+    
+    if not success:
+        return (False, error_msg), None
+    
+    try:
+        return (True, None), runner.run(binary, cases)
+    finally:
+        if os.path.exists(binary):
+            os.remove(binary)
+
+
+def _syntax_check_group(filepaths, timeout=60):
+    """
+    Syntax-check a group of files with one gcc invocation.
+    If the group fails, files named in the diagnostics are rechecked on
+    their own (so their error text is exactly what a single-file run
+    prints) and the remaining files are rechecked as a smaller group.
+    Without any file named, the group is split in half.
+    Returns a list of (success, error_message, decided) in input order.
+    """
+    if len(filepaths) == 1:
+        return [_run_gcc(filepaths[0], timeout, 'syntax')]
+    
+    try:
+        with SCHEDULER.slot():
+            result = _run_compiler(
+                ["gcc", "-fsyntax-only", *filepaths],
+                timeout=timeout,
+                text=True
+            )
+    except subprocess.TimeoutExpired:
+        result = None
+    except FileNotFoundError:
+        return [(False, "gcc compiler not found. Please install gcc/MinGW.", False)] * len(filepaths)
+    
+    if result is not None and result.returncode == 0:
+        return [(True, None, True)] * len(filepaths)
+    
+    stderr = result.stderr if result is not None else ''
+    suspects = [fp for fp in filepaths if f"{fp}:" in stderr]
+    
+    if not suspects:
+        mid = len(filepaths) // 2
+        return _syntax_check_group(filepaths[:mid], timeout) + _syntax_check_group(filepaths[mid:], timeout)
+    
+    outcomes = {fp: _run_gcc(fp, timeout, 'syntax') for fp in suspects}
+    rest = [fp for fp in filepaths if fp not in outcomes]
+    if rest:
+        outcomes.update(zip(rest, _syntax_check_group(rest, timeout)))
+    return [outcomes[fp] for fp in filepaths]
+
+
+def compile_batch(filepaths, timeout=60, cache=None):
+    """
+    Syntax-check several files with as few gcc invocations as possible.
+    Per-file results are identical to compile_c_file(..., mode='syntax').
+    Returns a list of (success, error_message) in the same order as filepaths.
+    """
+    outcomes = [None] * len(filepaths)
+    cache_keys = {}
+    
+    for i, filepath in enumerate(filepaths):
+        cache_key, cached = _cache_lookup(filepath, cache, 'syntax')
+        if cached is not None:
+            outcomes[i] = cached
+        else:
+            cache_keys[i] = cache_key
+    
+    pending = list(cache_keys)
+    if pending:
+        checked = _syntax_check_group([filepaths[i] for i in pending], timeout)
+        for i, (success, error_msg, decided) in zip(pending, checked):
+            outcomes[i] = (success, error_msg)
+            if cache_keys[i] and decided:
+                cache.put(cache_keys[i], filepaths[i], success, error_msg)
+    
+    return outcomes
+
+
+def resolve_worker_count(config):
+    """Number of compile workers for one request (defaults to the CPU count)"""
+    workers = config.get('compileWorkers') or os.cpu_count() or 1
+    return max(1, min(int(workers), MAX_CONCURRENT_COMPILES))
+
+
+def compile_files(filepaths, timeout=60, workers=1, cache=None, mode='link', on_result=None,
+                  batch_size=1, sources=None, durations=None, pch=None, tests=None, runner=None,
+                  test_results=None, session=None):
+    """
+    Compile many C files concurrently.
+    In 'syntax' mode with batch_size > 1, files are checked batch_size at a
+    time per gcc invocation (see compile_batch).
+    If sources is given (one bytes object per filepath), each file is compiled
+    from a temporary copy and filepaths only label the diagnostics.
+    on_result(index, outcome) is called as each file finishes, in completion order.
+    If durations is a list of len(filepaths), it receives each file's compile
+    wall time (for batches, the time of the whole batch).
+    pch is an optional PchSession for single-file compiles.
+    If tests is given (one list of test cases or None per filepath), files
+    with test cases are linked and run by runner (see compile_and_test)
+    whatever the mode, and test_results[index] receives their results
+    before on_result is called.
+    session is the SchedulerSession gcc slots are charged to; once it is
+    cancelled, running compiles are killed and files not yet compiled get
+    the session's cancel reason (CANCELLED_MESSAGE by default).
+    Returns a list of (success, error_message) in the same order as filepaths.
+    """
+    if mode != 'syntax' or sources is not None or tests is not None:
+        batch_size = 1
+    
+    units = [list(range(i, min(i + batch_size, len(filepaths))))
+             for i in range(0, len(filepaths), max(batch_size, 1))]
+    outcomes = [None] * len(filepaths)
+    
+    def run(indices):
+        started = time.perf_counter()
+        if session is not None:
+            with SCHEDULER.bind(session):
+                try:
+                    compile_unit(indices, started)
+                except SessionCancelled:
+                    # A compile killed by the cancel still took this long
+                    record_duration(indices, started)
+                    finish(indices, [(False, session.reason or CANCELLED_MESSAGE)] * len(indices))
+        else:
+            compile_unit(indices, started)
+    
+    def record_duration(indices, started):
+        if durations is not None:
+            elapsed = time.perf_counter() - started
+            for index in indices:
+                durations[index] = elapsed
+    
+    def compile_unit(indices, started):
+        if session is not None and session.cancelled:
+            raise SessionCancelled(session.name)
+        if len(indices) == 1:
+            index = indices[0]
+            source = sources[index] if sources is not None else None
+            cases = tests[index] if tests is not None else None
+            if cases:
+                outcome, test_results[index] = compile_and_test(
+                    filepaths[index], cases, runner, timeout, cache, source, pch
+                )
+                unit_outcomes = [outcome]
+            else:
+                unit_outcomes = [compile_c_file(filepaths[index], timeout, cache, mode, source, pch)]
+        else:
+            unit_outcomes = compile_batch([filepaths[i] for i in indices], timeout, cache)
+        record_duration(indices, started)
+        finish(indices, unit_outcomes)
+    
+    def finish(indices, unit_outcomes):
+        PENDING_COMPILES.dec(len(indices))
+        for index, outcome in zip(indices, unit_outcomes):
+            outcomes[index] = outcome
+            if on_result is not None:
+                on_result(index, outcome)
+    
+    PENDING_COMPILES.inc(len(filepaths))
+    if workers <= 1 or len(units) <= 1:
+        for unit in units:
+            run(unit)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, units))
+    
+    return outcomes
+
+
+# =============================================================================
+# Main Grading Function
+# =============================================================================
+
+def _track_in_flight(func):
+    """Count a grading run in grader_requests_in_flight while it runs"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+    return wrapper
+
+
+def _profile_if_requested(func):
+    """
+    With config['profile'] set, run the grading call under cProfile and save
+    the stats to PROFILE_DIR; the file path is returned as result['profile'].
+    Only the calling thread is profiled, so parallel compiles show up as
+    time spent waiting on the worker pool.
+    """
+    @wraps(func)
+    def wrapper(submissions_dir, config, *args, **kwargs):
+        if not config.get('profile'):
+            return func(submissions_dir, config, *args, **kwargs)
+        
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, submissions_dir, config, *args, **kwargs)
+        
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"grade_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{id(profiler):x}.prof")
+        profiler.dump_stats(profile_path)
+        result['profile'] = profile_path
+        return result
+    return wrapper
+
+
+class _PhaseClock:
+    """Wall time per grading phase; lap(name) closes the current phase"""
+    
+    def __init__(self):
+        self.started = self.mark = time.perf_counter()
+        self.phases = {}
+    
+    def lap(self, name):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.mark
+        self.mark = now
+    
+    def to_dict(self):
+        phases = {name: round(seconds, 6) for name, seconds in self.phases.items()}
+        phases['total'] = round(time.perf_counter() - self.started, 6)
+        return phases
+
+
+def _test_counts(file_tests):
+    """{'testsPassed', 'testsTotal'} for one file's test results"""
+    return {
+        'testsPassed': sum(1 for t in file_tests or () if t['passed']),
+        'testsTotal': len(file_tests or ())
+    }
+
+
+def _question_marks(files, marks_per_question):
+    """
+    Marks for a question whose files all compiled: full marks without test
+    cases, otherwise the share of its test runs (over all its files) passed.
+    """
+    passed = total = 0
+    for f in files:
+        counts = _test_counts(f.get('tests'))
+        passed += counts['testsPassed']
+        total += counts['testsTotal']
+    if not total:
+        return marks_per_question
+    return round(marks_per_question * passed / total, 2)
+
+
+def _error_entry(student_name, question_num, filename, error_msg, status):
+    """One errorLog record"""
+    return {
+        'student': student_name,
+        'question': question_num,
+        'filename': filename,
+        'message': error_msg[:500] if error_msg else 'Unknown error',
+        'status': status
+    }
+
+
+def error_records(results):
+    """
+    errorLog records of a result. A result graded with errorClusters has no
+    errorLog; its records are rebuilt from the run's stored DiagnosticSet.
+    """
+    if 'errorLog' in results:
+        return results['errorLog']
+    clusters = results.get('errorClusters')
+    diagnostics = DIAGNOSTICS.get(clusters['diagnosticsId']) if clusters else None
+    if diagnostics is None:
+        return []
+    return [
+        _error_entry(student_name, question_num, filename, message, status)
+        for filename, student_name, question_num, status, message in diagnostics.files()
+    ]
+
+
+def _record_history(results, config, files):
+    """
+    Record a run in HISTORY and set results['runId']. Best-effort: if the
+    database cannot be written the error is printed and the run is returned
+    without a runId.
+    """
+    try:
+        results['runId'] = HISTORY.record(results, config, files)
+    except (sqlite3.Error, OSError):
+        traceback.print_exc()
+
+
+def score_student(question_files, total_questions, marks_per_question):
+    """
+    Marks per question for one student's {question: [file entries]}.
+    A question scores only if all of its files compiled. A question whose
+    only failures are files the time budget left uncompiled is ungraded:
+    its marks are None, not 0.
+    Returns: ({question: marks or None}, has_errors)
+    """
+    grades = {q: 0.0 for q in range(1, total_questions + 1)}
+    has_errors = False
+    
+    for q_num in range(1, total_questions + 1):
+        files = question_files.get(q_num)
+        
+        if not files:
+            continue
+        
+        if all(f['compiled'] for f in files):
+            grades[q_num] = _question_marks(files, marks_per_question)
+        elif all(f['compiled'] or compile_status(False, f['error']) == 'not_graded' for f in files):
+            grades[q_num] = None
+        else:
+            has_errors = True
+    
+    return grades, has_errors
+
+
+def student_total(questions):
+    """Total of a student's question marks, leaving out ungraded (None) ones"""
+    return sum(q for q in questions if q is not None)
+
+
+def check_similarity(parsed, read_source, config):
+    """
+    Fingerprint every parsed file and rank similar pairs of different
+    students' files per question (see similarity.py). With
+    similarityHistory, this section's fingerprints are saved and also
+    compared against earlier sections of the same course and assignment.
+    parsed holds (filename, student, question, sub_part) tuples and
+    read_source(filename) returns the file's bytes or None.
+    """
+    entries = []
+    for filename, student_name, question_num, _ in parsed:
+        source = read_source(filename)
+        if source is None:
+            continue
+        fingerprints, signature = fingerprint(source)
+        entries.append(Fingerprint(filename, student_name, question_num, None, fingerprints, signature))
+    
+    archived = []
+    if config.get('similarityHistory'):
+        course = config.get('courseName')
+        assignment = config.get('assignmentName')
+        section = config.get('sectionName')
+        archived = FINGERPRINT_STORE.load(course, assignment, exclude_section=section)
+        FINGERPRINT_STORE.save(course, assignment, section, entries)
+    
+    threshold = float(config.get('similarityThreshold', 0.7))
+    pairs, candidates = find_similar(entries, threshold, archived)
+    return {
+        'threshold': threshold,
+        'files': len(entries),
+        'archivedFiles': len(archived),
+        'candidatePairs': candidates,
+        'pairs': sum(len(question_pairs) for question_pairs in pairs.values()),
+        'questions': {str(q): pairs[q] for q in sorted(pairs)}
+    }
+
+
+def summarize_scores(students_list, total_marks):
+    """
+    Average/highest/lowest/perfect scores and the grade distribution, over
+    the students with no ungraded question (a partial total is not a grade)
+    """
+    all_totals = [student['total'] for student in students_list if None not in student['questions']]
+    
+    # Calculate statistics
+    avg_score = sum(all_totals) / len(all_totals) if all_totals else 0
+    max_score = max(all_totals) if all_totals else 0
+    min_score = min(all_totals) if all_totals else 0
+    perfect_scores = sum(1 for t in all_totals if t == total_marks)
+    
+    # Grade distribution
+    score_counts = defaultdict(int)
+    for t in all_totals:
+        score_counts[t] += 1
+    
+    distribution = [
+        {'score': score, 'count': count}
+        for score, count in sorted(score_counts.items(), reverse=True)
+    ]
+    
+    return {
+        'averageScore': round(avg_score, 2),
+        'highestScore': max_score,
+        'lowestScore': min_score,
+        'perfectScores': perfect_scores,
+        'distribution': distribution
+    }
+
+
+@_profile_if_requested
+@_track_in_flight
+def grade_submissions(submissions_dir, config, progress=None):
+    """
+    Grade all C file submissions in the given directory, zip/tar archive or
+    {filename: source bytes} mapping.
+    If given, progress.set_total(n) is called once the files are parsed and
+    progress.file_done(record) after each compile finishes. A progress
+    object with an attach_session(session) method is handed the run's
+    SchedulerSession, so it can report queue times or cancel the run.
+    With config['report'] set, each student's row is written to the report
+    files as soon as all of the student's files are compiled.
+    With config['timeBudget'] set, the session is cancelled when the budget
+    runs out: running compiles are killed and the files left get
+    BUDGET_EXCEEDED_MESSAGE, so the result is partial but consistent.
+    Returns detailed results for the frontend.
+    """
+    total_questions = config.get('totalQuestions', 6)
+    marks_per_question = config.get('marksPerQuestion', 2.5)
+    compilation_timeout = config.get('compilationTimeout', 60)
+    compile_mode = config.get('compileMode', 'link')
+    test_cases = parse_test_cases(config.get('testCases'))
+    total_marks = total_questions * marks_per_question
+    clock = _PhaseClock()
+    
+    if compile_mode not in COMPILE_MODES:
+        return {
+            'success': False,
+            'error': f"Invalid compileMode '{compile_mode}' (expected one of: {', '.join(COMPILE_MODES)})"
+        }
+    
+    # Data structures
+    student_files = defaultdict(lambda: defaultdict(list))
+    parsing_errors = []
+    error_log = []
+    
+    # Get all C files
+    sources = None
+    duplicates = []
+    if isinstance(submissions_dir, dict):
+        # Already-loaded {filename: source bytes}, e.g. a shard from a coordinator
+        sources = {f: src for f, src in submissions_dir.items() if f.lower().endswith('.c')}
+        c_files = list(sources)
+    elif is_archive(submissions_dir):
+        try:
+            sources, duplicates = read_archive_sources(submissions_dir)
+        except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+            return {
+                'success': False,
+                'error': f'Could not read archive {submissions_dir}: {e}'
+            }
+        c_files = list(sources)
+        parsing_errors.extend(duplicates)
+    else:
+        try:
+            all_files = os.listdir(submissions_dir)
+        except FileNotFoundError:
+            return {
+                'success': False,
+                'error': f'Directory not found: {submissions_dir}'
+            }
+        
+        c_files = [f for f in all_files if f.lower().endswith('.c')]
+    
+    if not c_files:
+        return {
+            'success': False,
+            'error': 'No .c files found in the uploaded files'
+        }
+    
+    clock.lap('listFiles')
+    
+    # Pre-process for UUID mapping
+    parse_started = time.perf_counter()
+    file_mapping = map_unparsed_files(c_files, total_questions)
+    clock.lap('preprocess')
+    
+    # Parse every filename first, then compile the parsed files in parallel
+    parsed = []
+    for filename in sorted(c_files):
+        student_name, question_num, sub_part = parse_filename_enhanced(
+            filename, file_mapping, total_questions
+        )
+        
+        if student_name is None or question_num is None:
+            parsing_errors.append(filename)
+            continue
+        
+        parsed.append((filename, student_name, question_num, sub_part))
+    
+    clock.lap('parse')
+    PARSE_SECONDS.inc(time.perf_counter() - parse_started)
+    PARSE_FILES.inc(len(c_files))
+    
+    # Fingerprinting runs on its own thread while the workers wait on gcc
+    similarity_job = None
+    if config.get('similarity'):
+        if sources is not None:
+            read_source = sources.get
+        else:
+            read_source = lambda filename: _read_source(os.path.join(submissions_dir, filename))
+        similarity_pool = ThreadPoolExecutor(max_workers=1)
+        similarity_job = similarity_pool.submit(check_similarity, parsed, read_source, config)
+        similarity_pool.shutdown(wait=False)
+    
+    test_results = [None] * len(parsed) if test_cases else None
+    
+    report = None
+    if config.get('report'):
+        try:
+            report = StreamingReport(config.get('reportDir') or REPORT_DIR, config,
+                                     config.get('reportFormats') or ['xlsx'])
+        except ValueError as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        
+        # Rows go out in the order of results['students'], once none of the
+        # student's files are still compiling
+        report_order = {name: i for i, name in enumerate(sorted({p[1] for p in parsed}))}
+        report_pending = defaultdict(int)
+        for _, student_name, _, _ in parsed:
+            report_pending[student_name] += 1
+        report_files = defaultdict(lambda: defaultdict(list))
+        report_lock = threading.Lock()
+    
+    def report_file_done(index, outcome):
+        filename, student_name, question_num, sub_part = parsed[index]
+        success, error_msg = outcome
+        with report_lock:
+            report_files[student_name][question_num].append({
+                'filename': filename,
+                'sub_part': sub_part,
+                'compiled': success,
+                'error': error_msg,
+                'tests': test_results[index] if test_results is not None else None
+            })
+            report_pending[student_name] -= 1
+            if report_pending[student_name]:
+                return
+            question_files = report_files.pop(student_name)
+        
+        grades, _ = score_student(question_files, total_questions, marks_per_question)
+        questions = [grades[q] for q in range(1, total_questions + 1)]
+        errors = [
+            _error_entry(student_name, q_num, f['filename'], f['error'], compile_status(f['compiled'], f['error']))
+            for q_num in sorted(question_files)
+            for f in question_files[q_num]
+            if not f['compiled'] and compile_status(False, f['error']) != 'not_graded'
+        ]
+        report.student_done(report_order[student_name], student_name, questions, student_total(questions), errors)
+    
+    on_result = None
+    if progress is not None:
+        progress.set_total(len(parsed))
+    if progress is not None or report is not None:
+        
+        def on_result(index, outcome):
+            if report is not None:
+                report_file_done(index, outcome)
+            if progress is None:
+                return
+            filename, student_name, question_num, sub_part = parsed[index]
+            progress.file_done({
+                'filename': filename,
+                'student': student_name,
+                'question': question_num,
+                'subPart': sub_part,
+                'compiled': outcome[0],
+                'error': outcome[1],
+                'status': compile_status(*outcome),
+                'tests': _test_counts(test_results[index]) if test_results is not None else None
+            })
+    
+    cache = COMPILE_CACHE.session() if config.get('useCompileCache', True) else None
+    compile_started = time.perf_counter()
+    if sources is not None:
+        filepaths = [p[0] for p in parsed]
+        parsed_sources = [sources[p[0]] for p in parsed]
+    else:
+        filepaths = [os.path.join(submissions_dir, p[0]) for p in parsed]
+        parsed_sources = None
+    
+    durations = [0.0] * len(parsed) if config.get('timings') else None
+    pch = PCH_STORE.session() if config.get('usePch', True) else None
+    session = SCHEDULER.session(
+        f"{config.get('courseName', '')} {config.get('sectionName', '')}".strip(),
+        config.get('priority', 1)
+    )
+    if progress is not None and hasattr(progress, 'attach_session'):
+        progress.attach_session(session)
+    
+    # The budget covers the whole request, so it counts from the start
+    time_budget = config.get('timeBudget')
+    budget_timer = None
+    if time_budget:
+        remaining = float(time_budget) - (time.perf_counter() - clock.started)
+        budget_timer = threading.Timer(max(remaining, 0.0), session.cancel, kwargs={'reason': BUDGET_EXCEEDED_MESSAGE})
+        budget_timer.daemon = True
+        budget_timer.start()
+    
+    # Files of questions with test cases are linked and run against them
+    tests = None
+    runner = None
+    if test_cases:
+        tests = [tests_for(test_cases, p[2], p[3]) for p in parsed]
+        runner = TestRunner(
+            wall_timeout=config.get('testTimeout', 5),
+            cpu_seconds=int(config.get('testCpuSeconds', 2)),
+            memory_mb=int(config.get('testMemoryMb', 256)),
+            slot=SCHEDULER.slot
+        )
+    
+    try:
+        outcomes = compile_files(
+            filepaths,
+            compilation_timeout,
+            resolve_worker_count(config),
+            cache,
+            compile_mode,
+            on_result,
+            max(1, int(config.get('compileBatchSize') or 1)),
+            parsed_sources,
+            durations,
+            pch,
+            tests,
+            runner,
+            test_results,
+            session
+        )
+    finally:
+        if budget_timer is not None:
+            budget_timer.cancel()
+        session.close()
+        if runner is not None:
+            runner.close()
+    clock.lap('compile')
+    
+    compile_elapsed = time.perf_counter() - compile_started
+    if compile_elapsed > 0:
+        LAST_RUN_FILES_PER_SECOND.set(len(parsed) / compile_elapsed)
+    if cache is not None:
+        CACHE_LOOKUPS.inc(cache.hits, result='hit')
+        CACHE_LOOKUPS.inc(cache.misses, result='miss')
+    
+    # Process each file
+    compiled_ok = 0
+    compiled_fail = 0
+    resource_limited = 0
+    cancelled = 0
+    not_graded = 0
+    test_log = []
+    diagnostics = DiagnosticSet() if config.get('errorClusters') else None
+    
+    for index, ((filename, student_name, question_num, sub_part), (success, error_msg)) in enumerate(zip(parsed, outcomes)):
+        status = compile_status(success, error_msg)
+        FILES_GRADED.inc(status=status)
+        file_tests = test_results[index] if test_results is not None else None
+        student_files[student_name][question_num].append({
+            'filename': filename,
+            'sub_part': sub_part,
+            'compiled': success,
+            'error': error_msg,
+            'status': status,
+            'tests': file_tests
+        })
+        
+        if file_tests and not all(t['passed'] for t in file_tests):
+            test_log.append({
+                'student': student_name,
+                'question': question_num,
+                'filename': filename,
+                **_test_counts(file_tests),
+                'failures': [
+                    {'test': i + 1, 'status': t['status']}
+                    for i, t in enumerate(file_tests) if not t['passed']
+                ]
+            })
+        
+        if success:
+            compiled_ok += 1
+        elif status == 'not_graded':
+            # Not a compile failure: the question is left ungraded
+            not_graded += 1
+        else:
+            compiled_fail += 1
+            if status == 'resource_limit':
+                resource_limited += 1
+            elif status == 'cancelled':
+                cancelled += 1
+            if diagnostics is not None:
+                diagnostics.add(student_name, question_num, filename, status, error_msg)
+            else:
+                error_log.append(_error_entry(student_name, question_num, filename, error_msg, status))
+    
+    # Calculate grades
+    student_grades = {}
+    students_with_errors = 0
+    
+    for student_name in sorted(student_files.keys()):
+        student_grades[student_name], has_errors = score_student(
+            student_files[student_name], total_questions, marks_per_question
+        )
+        
+        if has_errors:
+            students_with_errors += 1
+    
+    clock.lap('grading')
+    
+    # Format results for frontend
+    students_list = []
+    
+    for student_name in sorted(student_grades.keys()):
+        grades = student_grades[student_name]
+        questions = [grades[q] for q in range(1, total_questions + 1)]
+        students_list.append({
+            'name': student_name,
+            'questions': questions,
+            'total': student_total(questions)
+        })
+    
+    summary = summarize_scores(students_list, total_marks)
+    
+    results = {
+        'success': True,
+        'totalStudents': len(student_grades),
+        'totalFiles': len(c_files) + len(duplicates),
+        'compiledOk': compiled_ok,
+        'compiledFail': compiled_fail,
+        'resourceLimited': resource_limited,
+        'cancelled': cancelled,
+        'notGraded': not_graded,
+        'partial': not_graded > 0,
+        'ungradedStudents': sum(1 for s in students_list if None in s['questions']),
+        'parsingErrors': len(parsing_errors),
+        'averageScore': summary['averageScore'],
+        'highestScore': summary['highestScore'],
+        'lowestScore': summary['lowestScore'],
+        'perfectScores': summary['perfectScores'],
+        'studentsWithErrors': students_with_errors,
+        'students': students_list,
+        'distribution': summary['distribution'],
+        'errorLog': error_log,
+        'totalMarks': total_marks,
+        'compileMode': compile_mode,
+        'compileCache': cache.to_dict() if cache else {'enabled': False},
+        'pch': pch.to_dict() if pch else {'enabled': False},
+        'scheduler': session.to_dict()
+    }
+    
+    if time_budget:
+        results['timeBudget'] = {
+            'seconds': time_budget,
+            'exceeded': session.reason == BUDGET_EXCEEDED_MESSAGE
+        }
+    
+    if diagnostics is not None:
+        del results['errorLog']
+        results['errorClusters'] = DIAGNOSTICS.put(diagnostics).summary()
+    
+    if test_results is not None:
+        ran = [t for file_tests in test_results if file_tests for t in file_tests]
+        results['tests'] = {
+            'questions': sorted(test_cases),
+            'executions': len(ran),
+            'passed': sum(1 for t in ran if t['passed']),
+            'failed': sum(1 for t in ran if not t['passed'])
+        }
+        results['testLog'] = test_log
+    
+    if similarity_job is not None:
+        results['similarity'] = similarity_job.result()
+        clock.lap('similarity')
+    
+    if report is not None:
+        results['report'] = report.close(results)
+        clock.lap('report')
+    
+    if config.get('history', True):
+        _record_history(results, config, [
+            {
+                'filename': filename,
+                'student': student_name,
+                'question': question_num,
+                'subPart': sub_part,
+                'status': compile_status(*outcome),
+                'error': outcome[1]
+            }
+            for (filename, student_name, question_num, sub_part), outcome in zip(parsed, outcomes)
+        ])
+        clock.lap('history')
+    
+    if durations is not None:
+        clock.lap('statistics')
+        slowest = sorted(range(len(parsed)), key=lambda i: durations[i], reverse=True)
+        results['timings'] = {
+            'phases': clock.to_dict(),
+            'slowestFiles': [
+                {
+                    'filename': parsed[i][0],
+                    'student': parsed[i][1],
+                    'question': parsed[i][2],
+                    'seconds': round(durations[i], 6),
+                    'status': compile_status(*outcomes[i])
+                }
+                for i in slowest[:int(config.get('timingsTopN') or 10)]
+            ]
+        }
+    
+    return results
+
+
+# =============================================================================
+# Distributed Grading - coordinator splits a session into per-student shards
+# =============================================================================
+
+# Worker base URLs (comma separated) that turn /grade into coordinator mode
+GRADER_WORKERS = [w.strip().rstrip('/') for w in os.environ.get('GRADER_WORKERS', '').split(',') if w.strip()]
+SHARDS_PER_WORKER = 2
+SHARD_TIMEOUT = float(os.environ.get('GRADER_SHARD_TIMEOUT', 3600))
+
+# How often a coordinator checks whether its run was cancelled
+CANCEL_POLL_SECONDS = 0.2
+
+
+class WorkerError(Exception):
+    """A shard could not be graded by any worker"""
+
+
+def load_sources(submissions_dir):
+    """
+    Read every .c file of a directory or archive into memory.
+    Returns: ({filename: source_bytes}, [duplicate archive members])
+    """
+    if is_archive(submissions_dir):
+        return read_archive_sources(submissions_dir)
+    
+    sources = {}
+    for filename in os.listdir(submissions_dir):
+        if filename.lower().endswith('.c'):
+            with open(os.path.join(submissions_dir, filename), 'rb') as f:
+                sources[filename] = f.read()
+    return sources, []
+
+
+def plan_shards(filenames, shard_count):
+    """
+    Split filenames into at most shard_count shards of similar size, never
+    splitting one student's files (preprocess_files orders them per student).
+    Returns a list of filename lists.
+    """
+    by_student = defaultdict(list)
+    for filename in filenames:
+        by_student[filename.split('_')[0].lower()].append(filename)
+    
+    shard_count = max(1, min(shard_count, len(by_student)))
+    shards = [[] for _ in range(shard_count)]
+    
+    # Largest students first, each onto the currently smallest shard
+    for student in sorted(by_student, key=lambda s: (-len(by_student[s]), s)):
+        smallest = min(range(shard_count), key=lambda i: len(shards[i]))
+        shards[smallest].extend(by_student[student])
+    
+    return [shard for shard in shards if shard]
+
+
+class _ShardConnections:
+    """
+    Open shard requests of one coordinator run. abort() shuts their sockets
+    down, so workers see the disconnect and cancel their compiles.
+    """
+    
+    def __init__(self, session):
+        self.session = session
+        self._open = set()
+        self._lock = threading.Lock()
+    
+    def post_json(self, url, payload, timeout):
+        """
+        POST JSON with the standard library; returns (status, decoded body).
+        Raises SessionCancelled if the session is cancelled first or the
+        request is aborted.
+        """
+        parts = urllib.parse.urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        conn = connection_class(parts.netloc, timeout=timeout)
+        try:
+            conn.connect()
+            with self._lock:
+                self._open.add(conn)
+            if self.session.cancelled:
+                raise SessionCancelled(self.session.name)
+            conn.request('POST', parts.path or '/', body=json.dumps(payload).encode('utf-8'),
+                         headers={'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            if self.session.cancelled:
+                raise SessionCancelled(self.session.name) from None
+            raise
+        finally:
+            with self._lock:
+                self._open.discard(conn)
+            conn.close()
+        
+        try:
+            return resp.status, json.loads(body.decode('utf-8'))
+        except ValueError:
+            if resp.status < 400:
+                raise
+            return resp.status, {'success': False, 'error': f"HTTP {resp.status} {resp.reason}"}
+    
+    def abort(self):
+        with self._lock:
+            conns = list(self._open)
+        for conn in conns:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, AttributeError):
+                pass
+
+
+def _grade_shard(shard_index, filenames, sources, config, workers, dead_workers, lock, connections,
+                 deadline=None):
+    """
+    Send one shard to a worker, moving on to the next live worker if the
+    connection fails or the worker answers with a server error. With a
+    deadline, each attempt gets what is left of the time budget.
+    Raises SessionCancelled once the coordinator's session is cancelled or
+    the deadline has passed.
+    Returns: (shard result, worker url, attempts)
+    """
+    payload = {
+        'config': config,
+        'sources': {f: base64.b64encode(sources[f]).decode('ascii') for f in filenames}
+    }
+    attempts = 0
+    errors = []
+    
+    for offset in range(len(workers)):
+        worker = workers[(shard_index + offset) % len(workers)]
+        with lock:
+            if worker in dead_workers:
+                continue
+        
+        if connections.session.cancelled:
+            raise SessionCancelled(connections.session.name)
+        if deadline is not None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise SessionCancelled(connections.session.name)
+            payload['config'] = {**config, 'timeBudget': remaining}
+        
+        attempts += 1
+        try:
+            status, result = connections.post_json(f"{worker}/shard", payload, SHARD_TIMEOUT)
+        except (http.client.HTTPException, OSError, ValueError) as e:
+            with lock:
+                dead_workers.add(worker)
+            errors.append(f"{worker}: {e}")
+            continue
+        
+        if status >= 500:
+            errors.append(f"{worker}: HTTP {status} {result.get('error', '')}")
+            continue
+        if status >= 400:
+            raise WorkerError(f"Shard {shard_index} rejected by {worker}: {result.get('error', status)}")
+        return result, worker, attempts
+    
+    raise WorkerError(f"Shard {shard_index} failed on every worker: {'; '.join(errors) or 'no live workers'}")
+
+
+class _UnsentShard:
+    """progress object for a shard graded locally with its session cancelled up front"""
+    
+    def __init__(self, reason):
+        self.reason = reason
+        self.records = []
+    
+    def set_total(self, total):
+        pass
+    
+    def attach_session(self, session):
+        session.cancel(reason=self.reason)
+    
+    def file_done(self, record):
+        self.records.append(record)
+
+
+def _grade_unsent_shard(filenames, sources, config, reason):
+    """
+    Result of a shard no worker graded: grade_submissions with a cancelled
+    session, so every file is marked with reason and nothing is compiled.
+    """
+    progress = _UnsentShard(reason)
+    result = grade_submissions({f: sources[f] for f in filenames}, {**config, 'timeBudget': None},
+                               progress=progress)
+    result['files'] = progress.records
+    return result
+
+
+def _merge_pch(shard_pch):
+    """One 'pch' block for the shards' blocks, as PchSession.to_dict gives it"""
+    if not any(p.get('enabled') for p in shard_pch):
+        return {'enabled': False}
+    used = sum(p.get('used', 0) for p in shard_pch)
+    compiles = sum(p.get('compiles', 0) for p in shard_pch)
+    return {
+        'enabled': True,
+        'used': used,
+        'compiles': compiles,
+        'fraction': round(used / compiles, 4) if compiles else 0.0
+    }
+
+
+def _merge_scheduler(shard_schedulers, config):
+    """One 'scheduler' block for the shards' blocks, as SchedulerSession.to_dict gives it"""
+    compiles = sum(s['compiles'] for s in shard_schedulers)
+    wait_total = sum(s['queueWaitSeconds']['total'] for s in shard_schedulers)
+    service_total = sum(s['serviceSeconds']['total'] for s in shard_schedulers)
+    return {
+        'name': f"{config.get('courseName', '')} {config.get('sectionName', '')}".strip(),
+        'priority': max(float(config.get('priority') or 1.0), 0.01),
+        'compiles': compiles,
+        'waiting': sum(s['waiting'] for s in shard_schedulers),
+        'cancelled': any(s['cancelled'] for s in shard_schedulers),
+        'cancelReason': next((s['cancelReason'] for s in shard_schedulers if s['cancelReason']), None),
+        'queueWaitSeconds': {
+            'total': round(wait_total, 6),
+            'mean': round(wait_total / compiles, 6) if compiles else 0.0,
+            'max': max((s['queueWaitSeconds']['max'] for s in shard_schedulers), default=0.0)
+        },
+        'serviceSeconds': {
+            'total': round(service_total, 6),
+            'mean': round(service_total / compiles, 6) if compiles else 0.0
+        }
+    }
+
+
+def merge_shard_results(shard_results, config, duplicates=()):
+    """Combine per-shard /shard results into one /grade-shaped result"""
+    total_marks = config.get('totalQuestions', 6) * config.get('marksPerQuestion', 2.5)
+    
+    students_list = sorted(
+        (student for result in shard_results for student in result['students']),
+        key=lambda student: student['name']
+    )
+    # Sorting by filename restores the order a single-process run logs errors in
+    error_log = sorted(
+        (entry for result in shard_results for entry in result['errorLog']),
+        key=lambda entry: entry['filename']
+    )
+    
+    def total(key):
+        return sum(result.get(key, 0) for result in shard_results)
+    
+    summary = summarize_scores(students_list, total_marks)
+    cache_hits = sum(r.get('compileCache', {}).get('hits', 0) for r in shard_results)
+    cache_misses = sum(r.get('compileCache', {}).get('misses', 0) for r in shard_results)
+    cache_enabled = any(r.get('compileCache', {}).get('enabled') for r in shard_results)
+    
+    merged = {
+        'success': True,
+        'totalStudents': len(students_list),
+        'totalFiles': total('totalFiles') + len(duplicates),
+        'compiledOk': total('compiledOk'),
+        'compiledFail': total('compiledFail'),
+        'resourceLimited': total('resourceLimited'),
+        'cancelled': total('cancelled'),
+        'notGraded': total('notGraded'),
+        'partial': total('notGraded') > 0,
+        'ungradedStudents': total('ungradedStudents'),
+        'parsingErrors': total('parsingErrors') + len(duplicates),
+        'averageScore': summary['averageScore'],
+        'highestScore': summary['highestScore'],
+        'lowestScore': summary['lowestScore'],
+        'perfectScores': summary['perfectScores'],
+        'studentsWithErrors': total('studentsWithErrors'),
+        'students': students_list,
+        'distribution': summary['distribution'],
+        'errorLog': error_log,
+        'totalMarks': total_marks,
+        'compileMode': config.get('compileMode', 'link'),
+        'compileCache': {
+            'enabled': cache_enabled,
+            'hits': cache_hits,
+            'misses': cache_misses,
+            'hitRate': round(cache_hits / (cache_hits + cache_misses), 4) if cache_hits + cache_misses else 0.0
+        } if cache_enabled else {'enabled': False},
+        'pch': _merge_pch([r.get('pch', {}) for r in shard_results]),
+        'scheduler': _merge_scheduler([r['scheduler'] for r in shard_results if 'scheduler' in r], config)
+    }
+    
+    budgets = [r['timeBudget'] for r in shard_results if 'timeBudget' in r]
+    if budgets:
+        merged['timeBudget'] = {
+            'seconds': budgets[0]['seconds'],
+            'exceeded': any(b['exceeded'] for b in budgets)
+        }
+    
+    test_summaries = [r['tests'] for r in shard_results if 'tests' in r]
+    if test_summaries:
+        merged['tests'] = {
+            'questions': test_summaries[0]['questions'],
+            'executions': sum(t['executions'] for t in test_summaries),
+            'passed': sum(t['passed'] for t in test_summaries),
+            'failed': sum(t['failed'] for t in test_summaries)
+        }
+        merged['testLog'] = sorted(
+            (entry for result in shard_results for entry in result.get('testLog', [])),
+            key=lambda entry: entry['filename']
+        )
+    
+    return merged
+
+
+@_track_in_flight
+def grade_distributed(submissions_dir, config, workers, progress=None):
+    """
+    Coordinator mode: shard the session by student, grade the shards on
+    worker processes over HTTP (retrying a shard elsewhere if its worker
+    dies) and merge the results into the usual grade_submissions shape.
+    A cancel (via progress.attach_session, like grade_submissions) aborts
+    the shard requests still running; their files, and those of shards
+    never sent, are marked cancelled. Workers get what is left of
+    config['timeBudget'], and shards not sent in time are marked not graded.
+    """
+    started = time.perf_counter()
+    try:
+        sources, duplicates = load_sources(submissions_dir)
+    except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+        return {'success': False, 'error': f'Could not read submissions {submissions_dir}: {e}'}
+    
+    if not sources:
+        return {
+            'success': False,
+            'error': 'No .c files found in the uploaded files'
+        }
+    
+    shards = plan_shards(sorted(sources), len(workers) * SHARDS_PER_WORKER)
+    
+    # The same files grade_submissions would grade: those resolving to a question
+    total_questions = config.get('totalQuestions', 6)
+    file_mapping = map_unparsed_files(list(sources), total_questions)
+    parsed = []
+    for filename in sorted(sources):
+        student_name, question_num, sub_part = parse_filename_enhanced(filename, file_mapping, total_questions)
+        if student_name is not None and question_num is not None:
+            parsed.append((filename, student_name, question_num, sub_part))
+    if progress is not None:
+        progress.set_total(len(parsed))
+    
+    # Similarity spans students, so it runs here rather than per shard
+    similarity_job = None
+    if config.get('similarity'):
+        similarity_pool = ThreadPoolExecutor(max_workers=1)
+        similarity_job = similarity_pool.submit(check_similarity, parsed, sources.get, config)
+        similarity_pool.shutdown(wait=False)
+    
+    # Shard results arrive whole, so the report is filled in after the merge
+    report = None
+    if config.get('report'):
+        try:
+            report = StreamingReport(config.get('reportDir') or REPORT_DIR, config,
+                                     config.get('reportFormats') or ['xlsx'])
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+    
+    # Workers must not fan out again, whatever the coordinator was asked
+    shard_config = {key: value for key, value in config.items() if key != 'profile'}
+    shard_config['similarity'] = False
+    shard_config['report'] = False
+    shard_config['errorClusters'] = False
+    shard_config['history'] = False
+    dead_workers = set()
+    lock = threading.Lock()
+    
+    session = SCHEDULER.session(
+        f"{config.get('courseName', '')} {config.get('sectionName', '')}".strip(),
+        config.get('priority', 1)
+    )
+    if progress is not None and hasattr(progress, 'attach_session'):
+        progress.attach_session(session)
+    connections = _ShardConnections(session)
+    time_budget = config.get('timeBudget')
+    deadline = started + float(time_budget) if time_budget else None
+    
+    def run(indexed_shard):
+        index, filenames = indexed_shard
+        shard_started = time.perf_counter()
+        try:
+            result, worker, attempts = _grade_shard(index, filenames, sources, shard_config, workers,
+                                                    dead_workers, lock, connections, deadline)
+        except SessionCancelled:
+            reason = (session.reason or CANCELLED_MESSAGE) if session.cancelled else BUDGET_EXCEEDED_MESSAGE
+            result, worker, attempts = _grade_unsent_shard(filenames, sources, shard_config, reason), None, 0
+        if progress is not None:
+            for record in result.get('files', []):
+                progress.file_done(record)
+        return result, {
+            'shard': index,
+            'worker': worker,
+            'files': len(filenames),
+            'attempts': attempts,
+            'seconds': round(time.perf_counter() - shard_started, 3)
+        }
+    
+    try:
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(run, indexed_shard) for indexed_shard in enumerate(shards)]
+            # A cancel cannot interrupt a blocked request, so poll and abort
+            while wait(futures, timeout=CANCEL_POLL_SECONDS).not_done:
+                if session.cancelled:
+                    connections.abort()
+            outcomes = [future.result() for future in futures]
+    except WorkerError as e:
+        if report is not None:
+            report.close()
+        return {'success': False, 'error': str(e)}
+    finally:
+        session.close()
+    
+    results = merge_shard_results([result for result, _ in outcomes], config, duplicates)
+    if time_budget:
+        results['timeBudget'] = {
+            'seconds': time_budget,
+            'exceeded': results.get('timeBudget', {}).get('exceeded', False) or bool(results['notGraded'])
+        }
+    results['shards'] = [info for _, info in outcomes]
+    if similarity_job is not None:
+        results['similarity'] = similarity_job.result()
+    if report is not None:
+        student_errors = defaultdict(list)
+        for entry in results.get('errorLog', []):
+            student_errors[entry['student']].append(entry)
+        for index, student in enumerate(results.get('students', [])):
+            report.student_done(index, student['name'], student['questions'], student['total'],
+                                student_errors[student['name']])
+        results['report'] = report.close(results)
+    if config.get('errorClusters') and results.get('success', False):
+        # Workers return messages cut to 500 characters; those are what is kept
+        diagnostics = DiagnosticSet()
+        for entry in results.pop('errorLog'):
+            diagnostics.add(entry['student'], entry['question'], entry['filename'], entry['status'], entry['message'])
+        results['errorClusters'] = DIAGNOSTICS.put(diagnostics).summary()
+    if config.get('history', True) and results.get('success', False):
+        _record_history(results, config, [
+            record for result, _ in outcomes for record in result.get('files', [])
+        ])
+    return results
@@ -0,0 +1,223 @@
+"""
+History of grading runs in an embedded SQLite database.
+
+Each successful run stores its config, summary statistics, every graded
+file's outcome and every student's scores, indexed by course/section/
+assignment and by student, so past results can be looked up (a student's
+scores across assignments, a section's failure rate over time, one run by
+id) without regrading or rescanning any files.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Result fields kept as the run's summary
+SUMMARY_KEYS = (
+    'totalStudents', 'totalFiles', 'compiledOk', 'compiledFail', 'resourceLimited',
+    'cancelled', 'notGraded', 'parsingErrors', 'averageScore', 'highestScore', 'lowestScore',
+    'perfectScores', 'studentsWithErrors', 'totalMarks', 'distribution', 'compileMode',
+    'timeBudget', 'partial', 'ungradedStudents'
+)
+
+MAX_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    course TEXT,
+    section TEXT,
+    assignment TEXT,
+    config TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    failed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_section ON runs (course, section, created);
+CREATE INDEX IF NOT EXISTS runs_assignment ON runs (course, assignment, created);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+
+CREATE TABLE IF NOT EXISTS files (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    student TEXT NOT NULL,
+    question INTEGER NOT NULL,
+    sub_part TEXT,
+    status TEXT NOT NULL,
+    message TEXT,
+    PRIMARY KEY (run_id, filename)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_student ON files (student, run_id);
+
+CREATE TABLE IF NOT EXISTS scores (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    student TEXT NOT NULL,
+    total REAL NOT NULL,
+    questions TEXT NOT NULL,
+    PRIMARY KEY (run_id, student)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scores_student ON scores (student, run_id);
+"""
+
+
+def _limit(limit):
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+class HistoryStore:
+    """Thread-safe run history; the database is created on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA foreign_keys=ON')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    # -- writing ----------------------------------------------------------------
+
+    def record(self, results, config, files):
+        """
+        Store one successful run. files are per-file records with filename,
+        student, question, subPart, status and error.
+        Returns: the new run id
+        """
+        run_id = uuid.uuid4().hex
+        summary = {key: results[key] for key in SUMMARY_KEYS if key in results}
+        failed = sum(1 for f in files if f['status'] not in ('compiled', 'not_graded'))
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute(
+                    'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (run_id, time.time(), config.get('courseName'), config.get('sectionName'),
+                     config.get('assignmentName'), json.dumps(config), json.dumps(summary),
+                     len(files), failed)
+                )
+                db.executemany(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    ((run_id, f['filename'], f['student'], f['question'], f.get('subPart'), f['status'],
+                      f['error'][:500] if f.get('error') else None)
+                     for f in files)
+                )
+                db.executemany(
+                    'INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)',
+                    ((run_id, s['name'], s['total'], json.dumps(s['questions']))
+                     for s in results.get('students', []))
+                )
+        return run_id
+
+    # -- queries ----------------------------------------------------------------
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    @staticmethod
+    def _run_row(row):
+        return {
+            'runId': row['id'],
+            'created': row['created'],
+            'courseName': row['course'],
+            'sectionName': row['section'],
+            'assignmentName': row['assignment'],
+            'files': row['files'],
+            'failed': row['failed'],
+            'summary': json.loads(row['summary'])
+        }
+
+    def runs(self, course=None, section=None, assignment=None, limit=50):
+        """Most recent runs first, optionally for one course/section/assignment"""
+        where, params = [], []
+        for column, value in (('course', course), ('section', section), ('assignment', assignment)):
+            if value is not None:
+                where.append(f'{column} = ?')
+                params.append(value)
+        sql = 'SELECT * FROM runs'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created DESC LIMIT ?'
+        return [self._run_row(row) for row in self._query(sql, (*params, _limit(limit)))]
+
+    def run(self, run_id):
+        """One run with its config, per-student scores and per-file outcomes, or None"""
+        rows = self._query('SELECT * FROM runs WHERE id = ?', (run_id,))
+        if not rows:
+            return None
+        run = self._run_row(rows[0])
+        run['config'] = json.loads(rows[0]['config'])
+        run['students'] = [
+            {'name': row['student'], 'questions': json.loads(row['questions']), 'total': row['total']}
+            for row in self._query('SELECT * FROM scores WHERE run_id = ? ORDER BY student', (run_id,))
+        ]
+        run['files'] = [
+            {
+                'filename': row['filename'],
+                'student': row['student'],
+                'question': row['question'],
+                'subPart': row['sub_part'],
+                'status': row['status'],
+                'message': row['message']
+            }
+            for row in self._query('SELECT * FROM files WHERE run_id = ? ORDER BY filename', (run_id,))
+        ]
+        return run
+
+    def student_scores(self, student, course=None, limit=100):
+        """One student's most recent scores across runs, oldest first"""
+        sql = ('SELECT runs.id, runs.created, runs.course, runs.section, runs.assignment, '
+               'runs.summary, scores.total, scores.questions '
+               'FROM scores JOIN runs ON runs.id = scores.run_id WHERE scores.student = ?')
+        params = [student]
+        if course is not None:
+            sql += ' AND runs.course = ?'
+            params.append(course)
+        sql += ' ORDER BY runs.created DESC LIMIT ?'
+        rows = self._query(sql, (*params, _limit(limit)))
+        return [
+            {
+                'runId': row['id'],
+                'created': row['created'],
+                'courseName': row['course'],
+                'sectionName': row['section'],
+                'assignmentName': row['assignment'],
+                'questions': json.loads(row['questions']),
+                'total': row['total'],
+                'totalMarks': json.loads(row['summary']).get('totalMarks')
+            }
+            for row in reversed(rows)
+        ]
+
+    def failure_rate(self, course, section, limit=100):
+        """Share of a section's files that failed to compile, per run, oldest first"""
+        rows = self._query(
+            'SELECT id, created, assignment, files, failed FROM runs '
+            'WHERE course = ? AND section = ? ORDER BY created DESC LIMIT ?',
+            (course, section, _limit(limit))
+        )
+        return [
+            {
+                'runId': row['id'],
+                'created': row['created'],
+                'assignmentName': row['assignment'],
+                'files': row['files'],
+                'failed': row['failed'],
+                'failureRate': round(row['failed'] / row['files'], 4) if row['files'] else 0.0
+            }
+            for row in reversed(rows)
+        ]
@@ -0,0 +1,177 @@
+"""
+Asynchronous grading jobs.
+
+A GradingJob runs grade_submissions on a background thread and records each
+file's compile result as it completes, so clients can poll progress or follow
+a server-sent-events stream instead of holding one long HTTP request open.
+"""
+
+import json
+import threading
+import time
+import traceback
+import uuid
+
+# Finished jobs are kept this long for late status/stream requests
+JOB_TTL_SECONDS = 3600
+
+
+class GradingJob:
+    """Progress and result of one background grading run"""
+
+    def __init__(self, session_dir, config):
+        self.id = uuid.uuid4().hex
+        self.session_dir = session_dir
+        self.config = config
+        self.status = 'queued'
+        self.total = 0
+        self.done = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.session = None
+        self.cancel_requested = False
+        self._cond = threading.Condition()
+
+    # -- progress hooks called by grade_submissions ---------------------------
+
+    def set_total(self, total):
+        with self._cond:
+            self.total = total
+            self._push('start', {'total': total})
+
+    def file_done(self, record):
+        with self._cond:
+            self.done += 1
+            self._push('file', record)
+
+    def attach_session(self, session):
+        with self._cond:
+            self.session = session
+            cancel = self.cancel_requested
+        if cancel:
+            session.cancel()
+
+    # -- lifecycle --------------------------------------------------------------
+
+    def cancel(self):
+        """Ask a queued or running job to stop compiling; it then ends as 'cancelled'"""
+        with self._cond:
+            if self.finished_or_failed:
+                return False
+            self.cancel_requested = True
+            session = self.session
+        if session is not None:
+            session.cancel()
+        return True
+
+    def run(self, grade_fn):
+        with self._cond:
+            self.status = 'running'
+            self.started = time.time()
+        try:
+            result = grade_fn(self.session_dir, self.config, progress=self)
+        except Exception as e:
+            traceback.print_exc()
+            result = {'success': False, 'error': str(e)}
+
+        with self._cond:
+            self.finished = time.time()
+            self.result = result
+            if self.cancel_requested:
+                self.status = 'cancelled'
+            elif result.get('success', False):
+                self.status = 'done'
+            else:
+                self.status = 'failed'
+                self.error = result.get('error')
+            self._push('end', {'status': self.status, 'error': self.error})
+
+    def wait(self, timeout=None):
+        """Block until the job has finished or timeout passes; True if finished"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished_or_failed, timeout)
+
+    def _push(self, event, data):
+        self.events.append((event, data))
+        self._cond.notify_all()
+
+    @property
+    def finished_or_failed(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def status_dict(self, include_result=False):
+        """Snapshot for the status endpoint: progress, throughput and ETA"""
+        with self._cond:
+            now = self.finished or time.time()
+            elapsed = now - self.started if self.started else 0.0
+            throughput = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = max(self.total - self.done, 0)
+            eta = remaining / throughput if throughput > 0 else None
+            status = {
+                'jobId': self.id,
+                'status': self.status,
+                'filesDone': self.done,
+                'filesTotal': self.total,
+                'elapsedSeconds': round(elapsed, 2),
+                'filesPerSecond': round(throughput, 2),
+                'etaSeconds': round(eta, 1) if eta is not None and not self.finished_or_failed else None,
+                'error': self.error
+            }
+            if self.session is not None:
+                status['scheduler'] = self.session.to_dict()
+            if include_result and self.finished_or_failed:
+                status['result'] = self.result
+            return status
+
+    def stream(self, keepalive=15):
+        """Yield server-sent-event frames, replaying past events first"""
+        index = 0
+        while True:
+            with self._cond:
+                if index >= len(self.events) and not self.finished_or_failed:
+                    self._cond.wait(timeout=keepalive)
+                pending = self.events[index:]
+                index += len(pending)
+                finished = self.finished_or_failed and index >= len(self.events)
+
+            if not pending and not finished:
+                yield ': keepalive\n\n'
+            for event, data in pending:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            if finished:
+                return
+
+
+class JobRegistry:
+    """Thread-safe registry of grading jobs with time-based expiry"""
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_dir, config, grade_fn):
+        job = GradingJob(session_dir, config)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        thread = threading.Thread(target=job.run, args=(grade_fn,), daemon=True)
+        thread.start()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
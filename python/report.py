@@ -0,0 +1,217 @@
+"""
+Grade reports written while grading runs.
+
+StreamingReport appends each student's row (and that student's compile
+errors) as soon as all of the student's files have been compiled, using an
+openpyxl write-only workbook and/or plain CSV files. Rows are streamed to
+disk, so memory stays flat however large the cohort is, and the report is
+complete as soon as the summary sheet is written at the end of the run.
+
+Rows are written in the order of the result's student list (sorted by
+name). A student who finishes early waits in a small reorder buffer until
+everyone before them has been written.
+"""
+
+import csv
+import os
+import re
+import threading
+import time
+import uuid
+
+REPORT_FORMATS = ('xlsx', 'csv')
+
+HEADER_COLOR = '3B82F6'
+STRIPE_COLOR = 'F1F5F9'
+FULL_MARKS_COLOR = '10B981'
+LOW_MARKS_COLOR = 'EF4444'
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(text)).strip('_')
+
+
+class StreamingReport:
+    """
+    Report for one grading run. Call student_done(index, ...) from any
+    thread as students finish, then close(results) once grading is over.
+    """
+
+    def __init__(self, directory, config, formats=('xlsx',)):
+        unknown = set(formats) - set(REPORT_FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown report format(s): {', '.join(sorted(unknown))} "
+                             f"(expected: {', '.join(REPORT_FORMATS)})")
+        self.config = config
+        self.total_questions = config.get('totalQuestions', 6)
+        self.total_marks = self.total_questions * config.get('marksPerQuestion', 2.5)
+        self.files = {}
+        self.rows = 0
+        self._next = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        stem = '_'.join(filter(None, [
+            'Grades',
+            _slug(config.get('courseName', '')),
+            _slug(config.get('sectionName', '')),
+            time.strftime('%Y%m%d_%H%M%S'),
+            uuid.uuid4().hex[:8]
+        ]))
+        stem = os.path.join(directory, stem)
+
+        self._workbook = None
+        if 'xlsx' in formats:
+            self._open_workbook(stem + '.xlsx')
+        self._csv_files = []
+        if 'csv' in formats:
+            self._open_csv(stem)
+
+    # -- setup ----------------------------------------------------------------
+
+    def _open_workbook(self, path):
+        # Imported on first use: openpyxl is the slowest import in the grader
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Font, PatternFill
+        from openpyxl.utils import get_column_letter
+
+        self._cell = WriteOnlyCell
+        self._font = Font
+        self._stripe = PatternFill('solid', fgColor=STRIPE_COLOR)
+        self._full_font = Font(bold=True, color=FULL_MARKS_COLOR)
+        self._low_font = Font(bold=True, color=LOW_MARKS_COLOR)
+
+        self._workbook = Workbook(write_only=True)
+        self._grades = self._workbook.create_sheet('Grades')
+        self._grades.sheet_properties.tabColor = HEADER_COLOR
+        self._errors = self._workbook.create_sheet('Error Log')
+        self._summary = self._workbook.create_sheet('Summary')
+        self._summary.sheet_properties.tabColor = FULL_MARKS_COLOR
+
+        # Column widths must be set before the first row is written
+        self._grades.column_dimensions['A'].width = 25
+        for column in range(2, self.total_questions + 3):
+            self._grades.column_dimensions[get_column_letter(column)].width = 12
+        for letter, width in zip('ABCDE', (25, 10, 40, 14, 100)):
+            self._errors.column_dimensions[letter].width = width
+        self._summary.column_dimensions['A'].width = 22
+        self._summary.column_dimensions['B'].width = 30
+
+        header_font = Font(bold=True, color='FFFFFF')
+        header_fill = PatternFill('solid', fgColor=HEADER_COLOR)
+        centered = Alignment(horizontal='center')
+
+        def header(sheet, titles):
+            cells = []
+            for title in titles:
+                cell = WriteOnlyCell(sheet, title)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = centered
+                cells.append(cell)
+            sheet.append(cells)
+
+        header(self._grades, self._grade_header())
+        header(self._errors, ['Student Name', 'Question', 'File Name', 'Status', 'Error Message'])
+        self.files['xlsx'] = path
+
+    def _open_csv(self, stem):
+        grades = open(stem + '.csv', 'w', encoding='utf-8', newline='')
+        errors = open(stem + '_errors.csv', 'w', encoding='utf-8', newline='')
+        self._csv_files = [grades, errors]
+        self._grades_csv = csv.writer(grades)
+        self._errors_csv = csv.writer(errors)
+        self._grades_csv.writerow(self._grade_header())
+        self._errors_csv.writerow(['Student Name', 'Question', 'File Name', 'Status', 'Error Message'])
+        self.files['csv'] = grades.name
+        self.files['errorsCsv'] = errors.name
+
+    def _grade_header(self):
+        return ['Student Name', *[f"Q{q}" for q in range(1, self.total_questions + 1)], 'Total Score']
+
+    # -- rows -----------------------------------------------------------------
+
+    def student_done(self, index, name, questions, total, errors):
+        """
+        Record a finished student. index is the student's position in the
+        final student list; errors is a list of errorLog-style dicts.
+        """
+        with self._lock:
+            self._pending[index] = (name, questions, total, errors)
+            while self._next in self._pending:
+                self._write(*self._pending.pop(self._next))
+                self._next += 1
+
+    def _write(self, name, questions, total, errors):
+        if self._workbook is not None:
+            stripe = self.rows % 2 == 1
+            row = []
+            for value in (name, *questions, total):
+                cell = self._cell(self._grades, value)
+                if stripe:
+                    cell.fill = self._stripe
+                row.append(cell)
+            # Ungraded questions are blank cells, and a partial total is not highlighted
+            partial = None in questions
+            if not partial and total == self.total_marks:
+                row[-1].font = self._full_font
+            elif not partial and total < self.total_marks * 0.5:
+                row[-1].font = self._low_font
+            self._grades.append(row)
+            for error in errors:
+                self._errors.append([error['student'], error['question'], error['filename'],
+                                     error['status'], error['message']])
+
+        if self._csv_files:
+            self._grades_csv.writerow([name, *questions, total])
+            for error in errors:
+                self._errors_csv.writerow([error['student'], error['question'], error['filename'],
+                                           error['status'], error['message']])
+        self.rows += 1
+
+    # -- finish ---------------------------------------------------------------
+
+    def close(self, results=None):
+        """Flush rows still buffered, write the summary and close the files"""
+        with self._lock:
+            for index in sorted(self._pending):
+                self._write(*self._pending.pop(index))
+
+            if self._workbook is not None:
+                if results is not None and results.get('success', False):
+                    self._write_summary(results)
+                self._workbook.save(self.files['xlsx'])
+                self._workbook = None
+            for f in self._csv_files:
+                f.close()
+            self._csv_files = []
+        return dict(self.files, rows=self.rows)
+
+    def _write_summary(self, results):
+        title = self._cell(self._summary, 'Grading Summary')
+        title.font = self._font(bold=True, size=14)
+        config = self.config
+        for row in (
+            [title],
+            [],
+            ['Course', config.get('courseName')],
+            ['Section', config.get('sectionName')],
+            ['Assignment', config.get('assignmentName')],
+            [],
+            ['Total Students', results['totalStudents']],
+            ['Average Score', f"{results['averageScore']:.2f}"],
+            ['Highest Score', results['highestScore']],
+            ['Lowest Score', results['lowestScore']],
+            ['Perfect Scores', results['perfectScores']],
+            ['Students with Errors', results['studentsWithErrors']],
+        ):
+            self._summary.append(row)
+        if results.get('partial'):
+            warning = self._cell(self._summary, 'PARTIAL RESULT')
+            warning.font = self._low_font
+            self._summary.append([])
+            self._summary.append([warning, f"{results['notGraded']} files not graded (time budget exceeded)"])
+            self._summary.append(['Ungraded Students', results['ungradedStudents']])
+            self._summary.append(['Note', 'Blank question cells are ungraded; statistics cover fully graded students'])
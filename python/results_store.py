@@ -0,0 +1,171 @@
+"""
+Server-side store of completed grading results in columnar form.
+
+A stored result keeps student names in one list, one array of doubles per
+question plus one for totals, a per-student error count, and the error
+records in a separate list. Clients fetch the summary on its own and page
+through sorted/filtered student rows or error records, instead of receiving
+every row of a large cohort in one response.
+"""
+
+import math
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+
+# Stored results are kept this long, and at most this many at once
+RESULT_TTL_SECONDS = 24 * 3600
+MAX_RESULTS = 20
+
+MAX_PAGE_SIZE = 1000
+_NAN = float('nan')
+STUDENT_SORT_KEYS = ('name', 'total', 'errors')  # plus 'q1', 'q2', ...
+
+
+class StoredResult:
+    """One grading result: summary dict plus columnar student and error data"""
+
+    def __init__(self, result, errors=None):
+        self.id = uuid.uuid4().hex
+        self.created = time.time()
+
+        students = result.get('students', [])
+        self.total_questions = len(students[0]['questions']) if students else 0
+        self.names = [s['name'] for s in students]
+        # Ungraded questions (None) are stored as NaN
+        self.scores = [array('d', (_NAN if s['questions'][q] is None else s['questions'][q] for s in students))
+                       for q in range(self.total_questions)]
+        self.totals = array('d', (s['total'] for s in students))
+        self.error_counts = array('I', bytes(4 * len(students)))
+
+        row_of = {name: i for i, name in enumerate(self.names)}
+        self.errors = []
+        for entry in result.get('errorLog', []) if errors is None else errors:
+            row = row_of.get(entry['student'])
+            if row is not None:
+                self.error_counts[row] += 1
+            self.errors.append((entry['student'], entry['question'], entry['filename'],
+                                entry.get('status', 'error'), entry['message']))
+
+        self.summary = {key: value for key, value in result.items() if key not in ('students', 'errorLog')}
+        self.summary['resultId'] = self.id
+        self.summary['errorCount'] = len(self.errors)
+
+    def _row(self, i):
+        return {
+            'name': self.names[i],
+            'questions': [None if math.isnan(column[i]) else column[i] for column in self.scores],
+            'total': self.totals[i],
+            'errors': self.error_counts[i]
+        }
+
+    def _sort_key(self, sort):
+        if sort == 'name':
+            return self.names.__getitem__
+        if sort == 'total':
+            return self.totals.__getitem__
+        if sort == 'errors':
+            return self.error_counts.__getitem__
+        if sort.startswith('q') and sort[1:].isdigit() and 1 <= int(sort[1:]) <= self.total_questions:
+            column = self.scores[int(sort[1:]) - 1]
+            # Ungraded sorts below every score
+            return lambda i: -math.inf if math.isnan(column[i]) else column[i]
+        raise ValueError(f"Invalid sort '{sort}' (expected one of: {', '.join(STUDENT_SORT_KEYS)}, q1..q{self.total_questions})")
+
+    def students(self, page=1, page_size=50, sort='name', order='asc', errors=None,
+                 score_at_least=None, score_below=None, search=None):
+        """
+        One page of student rows.
+        errors: 'only' (students with compile errors) or 'none' (without).
+        score_at_least / score_below filter on the total (>= and <).
+        search is a case-insensitive substring of the student name.
+        """
+        rows = range(len(self.names))
+        if errors == 'only':
+            rows = [i for i in rows if self.error_counts[i]]
+        elif errors == 'none':
+            rows = [i for i in rows if not self.error_counts[i]]
+        elif errors is not None:
+            raise ValueError(f"Invalid errors filter '{errors}' (expected 'only' or 'none')")
+        if score_at_least is not None:
+            rows = [i for i in rows if self.totals[i] >= score_at_least]
+        if score_below is not None:
+            rows = [i for i in rows if self.totals[i] < score_below]
+        if search:
+            needle = search.lower()
+            rows = [i for i in rows if needle in self.names[i].lower()]
+
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Invalid order '{order}' (expected 'asc' or 'desc')")
+        rows = sorted(rows, key=self._sort_key(sort), reverse=order == 'desc')
+        return self._page(rows, page, page_size, 'students', self._row)
+
+    def error_records(self, page=1, page_size=50, student=None, question=None, status=None):
+        """One page of error records, optionally for one student/question/status"""
+        rows = range(len(self.errors))
+        if student is not None:
+            rows = [i for i in rows if self.errors[i][0] == student]
+        if question is not None:
+            rows = [i for i in rows if self.errors[i][1] == question]
+        if status is not None:
+            rows = [i for i in rows if self.errors[i][3] == status]
+
+        def record(i):
+            student_name, question_num, filename, error_status, message = self.errors[i]
+            return {
+                'student': student_name,
+                'question': question_num,
+                'filename': filename,
+                'status': error_status,
+                'message': message
+            }
+        return self._page(list(rows), page, page_size, 'errors', record)
+
+    def _page(self, rows, page, page_size, field, build):
+        if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f'page must be >= 1 and pageSize between 1 and {MAX_PAGE_SIZE}')
+        start = (page - 1) * page_size
+        return {
+            'resultId': self.id,
+            'page': page,
+            'pageSize': page_size,
+            'total': len(rows),
+            'pages': (len(rows) + page_size - 1) // page_size,
+            field: [build(i) for i in rows[start:start + page_size]]
+        }
+
+
+class ResultStore:
+    """Thread-safe store of StoredResults with a size cap and time-based expiry"""
+
+    def __init__(self, max_results=MAX_RESULTS, ttl=RESULT_TTL_SECONDS):
+        self.max_results = max_results
+        self.ttl = ttl
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result, errors=None):
+        """
+        Store a successful grading result; returns the StoredResult.
+        errors are its error records if the result has no errorLog.
+        """
+        stored = StoredResult(result, errors)
+        with self._lock:
+            self._expire()
+            self._results[stored.id] = stored
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return stored
+
+    def get(self, result_id):
+        with self._lock:
+            self._expire()
+            return self._results.get(result_id)
+
+    def _expire(self):
+        now = time.time()
+        expired = [rid for rid, stored in self._results.items() if now - stored.created > self.ttl]
+        for rid in expired:
+            del self._results[rid]
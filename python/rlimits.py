@@ -0,0 +1,62 @@
+"""
+Resource limits for child processes (gcc and the submissions it builds).
+
+The limits are applied by an exec wrapper placed in front of the command
+rather than a preexec_fn: a preexec_fn runs Python in the forked child of a
+multi-threaded server, which can deadlock on a lock another thread held at
+fork time, and it forces subprocess off its vfork/posix_spawn fast path.
+The wrapper is util-linux prlimit, which sets the limits on itself and then
+execs the command; where prlimit is missing a tiny Python shim does the same.
+"""
+
+import shutil
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits
+    resource = None
+
+PRLIMIT = shutil.which('prlimit')
+
+# prlimit option name -> resource module constant, for the fallback shim
+_RESOURCES = {
+    'cpu': 'RLIMIT_CPU',
+    'as': 'RLIMIT_AS',
+    'fsize': 'RLIMIT_FSIZE',
+    'core': 'RLIMIT_CORE',
+    'nproc': 'RLIMIT_NPROC'
+}
+
+# Python ignores SIGPIPE and SIGXFSZ at startup and exec keeps ignored signals,
+# so the shim puts them back before handing over
+_SHIM = (
+    "import os, resource, signal, sys\n"
+    "split = sys.argv.index('--')\n"
+    "for limit in sys.argv[1:split]:\n"
+    "    name, soft, hard = limit.split(':')\n"
+    "    resource.setrlimit(getattr(resource, name), (int(soft), int(hard)))\n"
+    "signal.signal(signal.SIGPIPE, signal.SIG_DFL)\n"
+    "signal.signal(signal.SIGXFSZ, signal.SIG_DFL)\n"
+    "os.execv(sys.argv[split + 1], sys.argv[split + 1:])\n"
+)
+
+
+def limited(command, limits):
+    """
+    command prefixed with a wrapper that applies limits before it execs.
+    limits maps prlimit's option names (cpu, as, fsize, core, nproc) to
+    (soft, hard) pairs. Without rlimits (Windows) the command is
+    returned unchanged.
+    Raises FileNotFoundError, as Popen would, if the program does not exist.
+    """
+    program = shutil.which(command[0])
+    if program is None:
+        raise FileNotFoundError(command[0])
+    if resource is None or not limits:
+        return list(command)
+    if PRLIMIT:
+        options = [f"--{name}={soft}:{hard}" for name, (soft, hard) in limits.items()]
+        return [PRLIMIT, *options, '--', program, *command[1:]]
+    options = [f"{_RESOURCES[name]}:{soft}:{hard}" for name, (soft, hard) in limits.items()]
+    return [sys.executable, '-S', '-c', _SHIM, *options, '--', program, *command[1:]]
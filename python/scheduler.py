@@ -0,0 +1,242 @@
+"""
+Process-wide fair scheduling of gcc slots across grading sessions.
+
+Every grading run opens a SchedulerSession and its compile threads ask for
+slots through FairScheduler.slot(). A dispatcher thread takes a slot from the
+AdaptiveLimiter whenever one is free and gives it to the waiting session with
+the lowest virtual time (stride scheduling): each grant advances a session's
+virtual time by 1 / priority, so a priority-2 session gets twice the slots of
+a priority-1 session while both are waiting, and a 20-file quiz is served
+alongside a 2,000-file section instead of behind it. Within a session,
+waiters are served first come, first served.
+
+A cancelled session gets no more slots; its waiting and later requests
+raise SessionCancelled, and processes it tracks (running compiles) are
+killed.
+"""
+
+import os
+import signal
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class SessionCancelled(Exception):
+    """Raised to a compile thread whose session was cancelled"""
+
+
+def _kill(proc):
+    """Kill a tracked process and, if it leads one, its process group"""
+    try:
+        if os.name != 'nt' and os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass  # already exited
+
+
+class _Ticket:
+    __slots__ = ('queued', 'granted', 'cancelled', 'event')
+
+    def __init__(self):
+        self.queued = time.perf_counter()
+        self.granted = None
+        self.cancelled = False
+        self.event = threading.Event()
+
+
+class SchedulerSession:
+    """One grading run's share of the scheduler, with its wait/service times"""
+
+    def __init__(self, scheduler, name, priority):
+        self.scheduler = scheduler
+        self.name = name
+        self.priority = priority
+        self.vtime = 0.0
+        self.cancelled = False
+        self.reason = None
+        self.compiles = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.service_seconds = 0.0
+        self._queue = deque()
+        self._procs = set()
+
+    def cancel(self, reason=None):
+        """Stop handing out slots and kill the processes being tracked"""
+        self.scheduler.cancel(self, reason)
+
+    def close(self):
+        self.scheduler.close(self)
+
+    @contextmanager
+    def track(self, proc):
+        """Kill proc if the session is cancelled while the block runs"""
+        with self.scheduler._cond:
+            self._procs.add(proc)
+            cancelled = self.cancelled
+        if cancelled:
+            _kill(proc)
+        try:
+            yield proc
+        finally:
+            with self.scheduler._cond:
+                self._procs.discard(proc)
+
+    def to_dict(self):
+        with self.scheduler._cond:
+            return {
+                'name': self.name,
+                'priority': self.priority,
+                'compiles': self.compiles,
+                'waiting': len(self._queue),
+                'cancelled': self.cancelled,
+                'cancelReason': self.reason,
+                'queueWaitSeconds': {
+                    'total': round(self.wait_seconds, 6),
+                    'mean': round(self.wait_seconds / self.compiles, 6) if self.compiles else 0.0,
+                    'max': round(self.max_wait_seconds, 6)
+                },
+                'serviceSeconds': {
+                    'total': round(self.service_seconds, 6),
+                    'mean': round(self.service_seconds / self.compiles, 6) if self.compiles else 0.0
+                }
+            }
+
+
+class FairScheduler:
+    """Weighted fair queuing of an AdaptiveLimiter's slots between sessions"""
+
+    def __init__(self, limiter, on_wait=None):
+        self.limiter = limiter
+        self.on_wait = on_wait
+        self.waiting = 0
+        self._sessions = []
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._dispatcher = None
+        self._default = None
+
+    def session(self, name=None, priority=1.0):
+        """Register a grading run; close() it when the run is over"""
+        priority = max(float(priority or 1.0), 0.01)
+        with self._cond:
+            session = SchedulerSession(self, name, priority)
+            session.vtime = self._vtime
+            self._sessions.append(session)
+            return session
+
+    def close(self, session):
+        with self._cond:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            self._drop_waiters(session)
+
+    def cancel(self, session, reason=None):
+        with self._cond:
+            if not session.cancelled:
+                session.reason = reason
+            session.cancelled = True
+            self._drop_waiters(session)
+            procs = list(session._procs)
+        for proc in procs:
+            _kill(proc)
+
+    def _drop_waiters(self, session):
+        while session._queue:
+            ticket = session._queue.popleft()
+            ticket.cancelled = True
+            self.waiting -= 1
+            ticket.event.set()
+
+    @contextmanager
+    def bind(self, session):
+        """Make session the one this thread's slot() calls are charged to"""
+        previous = getattr(self._local, 'session', None)
+        self._local.session = session
+        try:
+            yield session
+        finally:
+            self._local.session = previous
+
+    def current(self):
+        """The session bound to this thread, or a shared default session"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            with self._cond:
+                if self._default is None:
+                    self._default = SchedulerSession(self, 'default', 1.0)
+                    self._sessions.append(self._default)
+                session = self._default
+        return session
+
+    @contextmanager
+    def slot(self):
+        """Hold one gcc slot for the current session while the block runs"""
+        session = self.current()
+        ticket = _Ticket()
+        with self._cond:
+            if session.cancelled:
+                raise SessionCancelled(session.name)
+            session._queue.append(ticket)
+            self.waiting += 1
+            self._ensure_dispatcher()
+            self._cond.notify_all()
+
+        ticket.event.wait()
+        if ticket.cancelled:
+            raise SessionCancelled(session.name)
+
+        waited = ticket.granted - ticket.queued
+        if self.on_wait is not None:
+            self.on_wait(waited)
+        try:
+            yield
+        finally:
+            service = time.perf_counter() - ticket.granted
+            self.limiter.release()
+            with self._cond:
+                session.compiles += 1
+                session.wait_seconds += waited
+                session.max_wait_seconds = max(session.max_wait_seconds, waited)
+                session.service_seconds += service
+
+    # -- dispatcher -------------------------------------------------------------
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch, name='compile-scheduler', daemon=True)
+            self._dispatcher.start()
+
+    def _next_ticket(self):
+        """Pop the head ticket of the waiting session with the lowest virtual time (lock held)"""
+        candidates = [s for s in self._sessions if s._queue]
+        if not candidates:
+            return None
+        session = min(candidates, key=lambda s: s.vtime)
+        # A session that sat idle does not bank credit for later
+        session.vtime = max(session.vtime, self._vtime)
+        self._vtime = session.vtime
+        session.vtime += 1.0 / session.priority
+        self.waiting -= 1
+        return session._queue.popleft()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self.waiting:
+                    self._cond.wait()
+
+            self.limiter.acquire()
+            with self._cond:
+                ticket = self._next_ticket()
+            if ticket is None:
+                # Everyone waiting was cancelled while we took the slot
+                self.limiter.release()
+                continue
+            ticket.granted = time.perf_counter()
+            ticket.event.set()
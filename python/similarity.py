@@ -0,0 +1,231 @@
+"""
+Source similarity (plagiarism) detection for C submissions.
+
+Each file is tokenized with identifiers, numbers, strings and characters
+replaced by placeholders (renaming variables or changing constants does not
+hide a copy), comments and preprocessor lines dropped. Token k-grams are
+hashed and winnowed into a fingerprint set; a MinHash signature of that set
+goes into a banded LSH index. Only files sharing a band bucket are compared,
+by the Jaccard similarity of their fingerprint sets, so the work grows with
+the number of similar pairs instead of with every pair.
+
+Fingerprints can be saved per course/assignment/section, so a new section is
+checked against earlier ones without re-reading their sources.
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import zlib
+from collections import defaultdict, namedtuple
+
+KGRAM = 5  # tokens per shingle
+WINDOW = 4  # winnowing window, in shingles
+NUM_PERM = 64  # MinHash signature length
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows each
+SEED = 115  # fixed, so stored signatures stay comparable
+
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(SEED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+C_KEYWORDS = frozenset('''
+    auto break case char const continue default do double else enum extern
+    float for goto if inline int long register restrict return short signed
+    sizeof static struct switch typedef union unsigned void volatile while
+    _Bool _Complex
+'''.split())
+
+_TOKEN = re.compile(rb'''
+    (?P<skip>//[^\n]*|/\*.*?(?:\*/|\Z)|^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<string>"(?:\\.|[^"\\\n])*")
+  | (?P<char>'(?:\\.|[^'\\\n])*')
+  | (?P<number>\.?[0-9](?:[eEpP][+-]|[\w.])*)
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<op>->|\+\+|--|<<=?|>>=?|[<>=!&|^+\-*/%]=|&&|\|\||\S)
+''', re.S | re.M | re.X)
+
+Fingerprint = namedtuple('Fingerprint', ['key', 'student', 'question', 'section', 'fingerprints', 'signature'])
+
+
+def tokenize(source):
+    """Normalized token stream of C source bytes"""
+    tokens = []
+    for match in _TOKEN.finditer(source):
+        kind = match.lastgroup
+        if kind == 'skip':
+            continue
+        if kind == 'ident':
+            word = match.group().decode('ascii')
+            tokens.append(word if word in C_KEYWORDS else 'I')
+        elif kind == 'op':
+            tokens.append(match.group().decode('latin-1'))
+        else:
+            tokens.append(kind[0].upper())
+    return tokens
+
+
+def winnow(tokens, k=KGRAM, window=WINDOW):
+    """Winnowed set of k-gram hashes (the minimum of each window of hashes)"""
+    grams = [zlib.crc32(' '.join(tokens[i:i + k]).encode()) for i in range(len(tokens) - k + 1)]
+    if len(grams) <= window:
+        return set(grams)
+    return {min(grams[i:i + window]) for i in range(len(grams) - window + 1)}
+
+
+def minhash(fingerprints):
+    """MinHash signature of a fingerprint set (empty list for an empty set)"""
+    if not fingerprints:
+        return []
+    return [min((a * x + b) % _MERSENNE for x in fingerprints) for a, b in _PERMUTATIONS]
+
+
+def fingerprint(source):
+    """(fingerprint set, MinHash signature) of C source bytes"""
+    fingerprints = winnow(tokenize(source))
+    return fingerprints, minhash(fingerprints)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class LshIndex:
+    """Banded LSH over MinHash signatures; yields candidate pairs of keys"""
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+
+    def add(self, key, signature):
+        for band, buckets in enumerate(self._buckets):
+            start = band * self.rows
+            buckets[tuple(signature[start:start + self.rows])].append(key)
+
+    def candidate_pairs(self):
+        pairs = set()
+        for buckets in self._buckets:
+            for keys in buckets.values():
+                for i in range(len(keys)):
+                    for j in range(i + 1, len(keys)):
+                        pairs.add((keys[i], keys[j]) if keys[i] < keys[j] else (keys[j], keys[i]))
+        return pairs
+
+
+def find_similar(entries, threshold=0.7, archived=()):
+    """
+    Rank similar pairs of different students' files, per question.
+    entries and archived are Fingerprint lists; archived ones (earlier
+    sections) are only paired with entries, never with each other.
+    Returns: ({question: [pair, ...] highest score first}, candidate pair count)
+    """
+    by_key = {}
+    indexes = defaultdict(LshIndex)
+    for entry in list(entries) + list(archived):
+        if entry.signature:
+            key = (entry.section or '', entry.key)
+            by_key[key] = entry
+            indexes[entry.question].add(key, entry.signature)
+
+    current = {(e.section or '', e.key) for e in entries}
+    similar = defaultdict(list)
+    candidates = 0
+    for question, index in indexes.items():
+        for key_a, key_b in index.candidate_pairs():
+            if key_a not in current and key_b not in current:
+                continue
+            a, b = by_key[key_a], by_key[key_b]
+            if a.student == b.student and a.section == b.section:
+                continue
+            candidates += 1
+            score = jaccard(a.fingerprints, b.fingerprints)
+            if score >= threshold:
+                if key_a not in current:
+                    a, b = b, a
+                similar[question].append({
+                    'score': round(score, 4),
+                    'a': {'student': a.student, 'filename': a.key},
+                    'b': {'student': b.student, 'filename': b.key, 'section': b.section}
+                })
+
+    for pairs in similar.values():
+        pairs.sort(key=lambda p: (-p['score'], p['a']['filename'], p['b']['filename']))
+    return dict(similar), candidates
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(text)).strip('_') or 'default'
+
+
+class FingerprintStore:
+    """
+    Fingerprints saved as one JSON file per section under
+    root/<course>__<assignment>/<section>.json
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _dir(self, course, assignment):
+        return os.path.join(self.root, f"{_slug(course)}__{_slug(assignment)}")
+
+    def _params(self):
+        return {'kgram': KGRAM, 'window': WINDOW, 'numPerm': NUM_PERM, 'seed': SEED}
+
+    def save(self, course, assignment, section, entries):
+        """Replace the stored fingerprints of one section"""
+        directory = self._dir(course, assignment)
+        path = os.path.join(directory, _slug(section) + '.json')
+        data = {
+            'section': section,
+            'params': self._params(),
+            'files': [
+                {
+                    'filename': e.key,
+                    'student': e.student,
+                    'question': e.question,
+                    'fingerprints': sorted(e.fingerprints),
+                    'signature': e.signature
+                }
+                for e in entries
+            ]
+        }
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def load(self, course, assignment, exclude_section=None):
+        """Stored fingerprints of every other section of the assignment"""
+        directory = self._dir(course, assignment)
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return []
+
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get('params') != self._params() or data.get('section') == exclude_section:
+                continue
+            entries.extend(
+                Fingerprint(f['filename'], f['student'], f['question'], data['section'],
+                            set(f['fingerprints']), f['signature'])
+                for f in data.get('files', [])
+            )
+        return entries
@@ -0,0 +1,209 @@
+"""
+Isolated execution of compiled submissions against stdin/stdout test cases.
+
+Each worker thread gets one directory for the binary it builds, and every
+test runs in a fresh, empty working directory that is removed afterwards.
+Programs are started directly (no shell) in their own process group, with
+CPU-time, memory, output-size and process-count rlimits on POSIX, a
+wall-clock timeout that kills the whole group, and stdout written to a file
+so a runaway print loop cannot exhaust the grader's memory.
+
+When the grader runs as root, programs also run as an unprivileged account
+(GRADER_SANDBOX_USER, default nobody), so they cannot write the compile
+cache, the history database or anything else the grader owns. Run as any
+other user, the grader cannot switch accounts and a program has that user's
+file access.
+"""
+
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+
+try:
+    import pwd
+except ImportError:  # Windows: no accounts to switch to
+    pwd = None
+
+from rlimits import limited
+
+# Account programs run as when the grader itself runs as root
+SANDBOX_USER = os.environ.get('GRADER_SANDBOX_USER', 'nobody')
+
+BINARY_NAME = 'submission.exe' if os.name == 'nt' else 'submission'
+STDOUT_NAME = '.stdout'
+
+
+def normalize_output(text):
+    """Ignore trailing whitespace on each line and trailing blank lines"""
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines)
+
+
+def parse_test_cases(config_tests):
+    """
+    Normalize config['testCases'] to {key: [{'stdin': str, 'expectedStdout': str}]}.
+    Keys are question numbers ("3") or question + sub-part ("3a").
+    """
+    tests = {}
+    for key, cases in (config_tests or {}).items():
+        tests[str(key).strip().lower()] = [
+            {'stdin': case.get('stdin', ''), 'expectedStdout': case.get('expectedStdout', '')}
+            for case in cases
+        ]
+    return tests
+
+
+def sandbox_account():
+    """
+    (uid, gid) of SANDBOX_USER, or None if the grader is not root (and so
+    cannot switch accounts) or the account does not exist
+    """
+    if pwd is None or os.geteuid() != 0:
+        return None
+    try:
+        account = pwd.getpwnam(SANDBOX_USER)
+    except KeyError:
+        return None
+    return account.pw_uid, account.pw_gid
+
+
+def tests_for(test_cases, question, sub_part):
+    """Test cases for a file: its sub-part's own list, else the question's"""
+    if sub_part and f"{question}{sub_part}" in test_cases:
+        return test_cases[f"{question}{sub_part}"]
+    return test_cases.get(str(question))
+
+
+class TestRunner:
+    """Runs test cases for one grading session; call close() when done"""
+
+    def __init__(self, wall_timeout=5, cpu_seconds=2, memory_mb=256, output_kb=1024, max_processes=16,
+                 slot=None):
+        self.wall_timeout = wall_timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.output_kb = output_kb
+        self.max_processes = max_processes
+        self.slot = slot
+        self.account = sandbox_account()
+        self.root = tempfile.mkdtemp(prefix='grader-tests-')
+        if self.account is not None:
+            # The program's account may pass through to its binary, nothing more
+            os.chmod(self.root, 0o711)
+        self._local = threading.local()
+        if os.name == 'nt':
+            self._env = dict(os.environ)
+        else:
+            self._env = {'PATH': '/usr/bin:/bin', 'LANG': 'C'}
+
+    def workdir(self):
+        """This thread's scratch directory, created once and then reused"""
+        workdir = getattr(self._local, 'workdir', None)
+        if workdir is None:
+            workdir = tempfile.mkdtemp(dir=self.root)
+            if self.account is not None:
+                os.chmod(workdir, 0o711)
+            self._local.workdir = workdir
+        return workdir
+
+    def binary_path(self):
+        """Where the compile step should write the executable for this thread"""
+        return os.path.join(self.workdir(), BINARY_NAME)
+
+    def _limits(self):
+        """
+        rlimits for a submission run (see rlimits.py); none apply on Windows.
+        nproc counts every process of the account the program runs as, so
+        without an account switch the grader's own user usually leaves it none
+        to fork.
+        """
+        cpu = self.cpu_seconds
+        memory = self.memory_mb * 1024 * 1024
+        output = self.output_kb * 1024
+        return {
+            'cpu': (cpu, cpu + 1),
+            'as': (memory, memory),
+            'fsize': (output, output),
+            'core': (0, 0),
+            'nproc': (self.max_processes, self.max_processes)
+        }
+
+    def run_one(self, binary, case):
+        """Run the binary once; returns {'status', 'passed', 'exitCode'}"""
+        # stdout goes next to the binary, out of reach of the program's cwd
+        stdout_path = os.path.join(os.path.dirname(binary), STDOUT_NAME)
+        rundir = tempfile.mkdtemp(prefix='run-', dir=self.root)
+        uid, gid = self.account or (None, None)
+        if self.account is not None:
+            os.chown(rundir, uid, gid)
+
+        try:
+            with open(stdout_path, 'wb') as stdout:
+                proc = subprocess.Popen(
+                    limited([binary], self._limits()),
+                    stdin=subprocess.PIPE,
+                    stdout=stdout,
+                    stderr=subprocess.DEVNULL,
+                    cwd=rundir,
+                    env=self._env,
+                    close_fds=True,
+                    start_new_session=os.name != 'nt',
+                    user=uid,
+                    group=gid,
+                    extra_groups=[] if self.account is not None else None
+                )
+                try:
+                    proc.communicate(case['stdin'].encode(), timeout=self.wall_timeout)
+                except subprocess.TimeoutExpired:
+                    self._kill(proc)
+                    return {'status': 'timeout', 'passed': False, 'exitCode': None}
+                except (BrokenPipeError, OSError):
+                    proc.wait()
+            # Children it forked and left running go with it
+            self._kill(proc)
+        finally:
+            shutil.rmtree(rundir, ignore_errors=True)
+
+        returncode = proc.returncode
+        if returncode < 0:
+            if -returncode == getattr(signal, 'SIGXCPU', None):
+                status = 'cpu_limit'
+            elif -returncode == getattr(signal, 'SIGXFSZ', None):
+                status = 'output_limit'
+            else:
+                status = 'crashed'
+            return {'status': status, 'passed': False, 'exitCode': returncode}
+
+        with open(stdout_path, 'rb') as f:
+            actual = f.read().decode(errors='replace')
+        passed = normalize_output(actual) == normalize_output(case['expectedStdout'])
+        return {'status': 'passed' if passed else 'wrong_output', 'passed': passed, 'exitCode': returncode}
+
+    def run(self, binary, cases):
+        """Run every case against binary, inside slot() per execution if given"""
+        results = []
+        for case in cases:
+            if self.slot is not None:
+                with self.slot():
+                    results.append(self.run_one(binary, case))
+            else:
+                results.append(self.run_one(binary, case))
+        return results
+
+    def _kill(self, proc):
+        try:
+            if os.name != 'nt':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except OSError:
+            pass
+        proc.wait()
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
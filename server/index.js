@@ -91,7 +91,12 @@ app.post("/api/grade", upload.array("files"), async (req, res) => {
       `${PYTHON_API_URL}/grade`,
       {
         sessionDir,
-        config,
+        // The grader writes the Excel report itself while it grades
+        config: {
+          ...config,
+          report: true,
+          reportDir: resultsDir,
+        },
       },
       {
         timeout: 300000, // 5 minutes timeout
@@ -105,8 +110,10 @@ app.post("/api/grade", upload.array("files"), async (req, res) => {
     latestConfig = config;
     latestErrorLog = gradingResults.errorLog || [];
 
-    // Generate Excel file
-    await generateExcelFile(gradingResults, config, sessionId);
+    // Generate Excel file, unless the grader already wrote it
+    if (!hasStreamedReport(gradingResults)) {
+      await generateExcelFile(gradingResults, config, sessionId);
+    }
 
     // Generate error log file
     await generateErrorLogFile(gradingResults, config, sessionId);
@@ -144,7 +151,11 @@ app.get("/api/download-excel", async (req, res) => {
         .json({ error: "No results available. Please run grading first." });
     }
 
-    // Always regenerate Excel file from latest results to ensure fresh data
+    if (hasStreamedReport(latestResults)) {
+      return res.download(latestResults.report.xlsx, `Compilation_Grades.xlsx`);
+    }
+
+    // Otherwise regenerate Excel file from latest results to ensure fresh data
     const filename = `Grades_download_${Date.now()}.xlsx`;
     const filepath = path.join(resultsDir, filename);
     await generateExcelFile(latestResults, latestConfig, "download");
@@ -199,6 +210,11 @@ app.get("/api/download-error-log", async (req, res) => {
 // Helper Functions
 // =============================================================================
 
+// Whether the grader streamed an Excel report this server can read
+function hasStreamedReport(results) {
+  return Boolean(results?.report?.xlsx && fs.existsSync(results.report.xlsx));
+}
+
 async function generateExcelFile(results, config, sessionId) {
   const workbook = new ExcelJS.Workbook();
   workbook.creator = "C Autograder";
@@ -244,9 +260,11 @@ async function generateExcelFile(results, config, sessionId) {
     // Color code total score
     const totalCell = dataRow.getCell(headers.length);
     const totalMarks = config.totalQuestions * config.marksPerQuestion;
-    if (student.total === totalMarks) {
+    // Ungraded questions are blank cells; a partial total is not highlighted
+    const partial = student.questions.includes(null);
+    if (!partial && student.total === totalMarks) {
       totalCell.font = { bold: true, color: { argb: "10B981" } };
-    } else if (student.total < totalMarks * 0.5) {
+    } else if (!partial && student.total < totalMarks * 0.5) {
       totalCell.font = { bold: true, color: { argb: "EF4444" } };
     }
   });
@@ -274,6 +292,19 @@ async function generateExcelFile(results, config, sessionId) {
   summarySheet.addRow(["Lowest Score", results.lowestScore]);
   summarySheet.addRow(["Perfect Scores", results.perfectScores]);
   summarySheet.addRow(["Students with Errors", results.studentsWithErrors]);
+  if (results.partial) {
+    summarySheet.addRow([]);
+    const warningRow = summarySheet.addRow([
+      "PARTIAL RESULT",
+      `${results.notGraded} files not graded (time budget exceeded)`,
+    ]);
+    warningRow.font = { bold: true, color: { argb: "EF4444" } };
+    summarySheet.addRow(["Ungraded Students", results.ungradedStudents]);
+    summarySheet.addRow([
+      "Note",
+      "Blank question cells are ungraded; statistics cover fully graded students",
+    ]);
+  }
 
   // Save file
   const filename = `Grades_${sessionId}_${Date.now()}.xlsx`;
@@ -345,6 +376,11 @@ async function generateErrorLogFile(results, config, sessionId) {
   content += `Lowest Score: ${results.lowestScore}/${totalMarks}\n`;
   content += `Perfect Scores: ${results.perfectScores}\n`;
   content += `Students with Errors: ${results.studentsWithErrors}\n`;
+  if (results.partial) {
+    content += `\nPARTIAL RESULT: ${results.notGraded} files not graded (time budget exceeded), `;
+    content += `${results.ungradedStudents} students with ungraded questions.\n`;
+    content += `Statistics above cover fully graded students only.\n`;
+  }
 
   // Save file
   const filename = `Error_Log_${sessionId}_${timestamp}.txt`;